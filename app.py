@@ -2,15 +2,25 @@ import streamlit as st
 import pandas as pd
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
+from requests.adapters import HTTPAdapter
 import os
-import re
-import bcrypt
-import smtplib
 from email.mime.text import MIMEText
 import random
 import string
 import time
+import logging
 from datetime import datetime, timezone, timedelta
+from search_index import build_search_index
+from log_writer import LogWriter
+from user_directory import UserDirectory
+from catalog_cache import CatalogCache
+from catalog_snapshot import CatalogSnapshot
+from catalog_db import CatalogDB
+from shared_cache import SharedCache
+from passwords import PasswordHasher, DEFAULT_ROUNDS
+from mailer import MailDispatcher
+from local_sheets import LocalClient
+from metrics import metrics
 
 # === 1. 頁面設定 ===
 st.set_page_config(page_title="士電牌價查詢系統", layout="wide")
@@ -53,13 +63,63 @@ input[type="text"] {
 if "email" in st.secrets:
     SMTP_EMAIL = st.secrets["email"]["smtp_email"]
     SMTP_PASSWORD = st.secrets["email"]["smtp_password"]
+    # 以下可省略；測試時可指向本機 SMTP (例如 aiosmtpd，starttls 設為 false)
+    SMTP_HOST = st.secrets["email"].get("smtp_host", "smtp.gmail.com")
+    SMTP_PORT = int(st.secrets["email"].get("smtp_port", 587))
+    SMTP_STARTTLS = bool(st.secrets["email"].get("smtp_starttls", True))
 else:
     SMTP_EMAIL = ""
     SMTP_PASSWORD = ""
+    SMTP_HOST, SMTP_PORT, SMTP_STARTTLS = "smtp.gmail.com", 587, True
 
 GOOGLE_SHEET_NAME = '經銷牌價表_資料庫'
+# 有設定試算表 ID 時直接 open_by_key，省下一次 Drive 名稱查詢
+GOOGLE_SHEET_KEY = st.secrets["google_sheet_key"] if "google_sheet_key" in st.secrets else ""
+CLIENT_TTL = 3000     # 秒；比 Google access token 的一小時效期短，到期前重新授權
+HTTP_POOL_SIZE = 20   # 所有使用者共用的 HTTP 連線池大小
+# 效能測試用：設定 [local_sheets] path (與可選的 latency 秒數) 時改讀本機 SQLite 模擬的試算表，不連 Google
+LOCAL_SHEETS = dict(st.secrets["local_sheets"]) if "local_sheets" in st.secrets else {}
+LOG_FLUSH_INTERVAL = 5  # 秒；Logs 背景批次寫入的間隔
+LOG_BATCH_SIZE = 50     # 累積多少筆就提前送出
+LOG_SPILL_FILE = 'logs_spill.jsonl'  # API 被限流時暫存的本機檔案
+USER_CACHE_TTL = 60     # 秒；Users 帳號索引的快取時間
+# 同一台主機所有 worker 共用的快取目錄 (更新日期、Users 帳號表)；多個 replica 要指向同一個目錄
+SHARED_CACHE_DIR = st.secrets["shared_cache_dir"] if "shared_cache_dir" in st.secrets else '.shared_cache'
+# bcrypt 成本參數；調整後使用者下次登入時會自動以新成本重新雜湊
+BCRYPT_ROUNDS = int(st.secrets["bcrypt_rounds"]) if "bcrypt_rounds" in st.secrets else DEFAULT_ROUNDS
+BCRYPT_WORKERS = 4      # 同時進行 bcrypt 運算的執行緒數
+CATALOG_CHECK_INTERVAL = 60  # 秒；背景檢查 Users!D1 更新日期的間隔
+CATALOG_MAX_AGE = 3600       # 秒；即使日期沒變，超過這個時間也重新下載一次
+CATALOG_SNAPSHOT_FILE = 'catalog_snapshot.arrow'  # 本機快照：冷啟動與 API 斷線時使用
+# data_merger --target sqlite 產生的牌價檔；設定後直接在 SQLite 內搜尋，不再下載整張 Google Sheet
+CATALOG_DB = st.secrets["catalog_db"] if "catalog_db" in st.secrets else ""
 SEARCH_COLS = ['NO.', '規格', '說明']
+CODE_COLS = ['NO.', '規格']  # 型號欄位：建立前綴索引用
 DISPLAY_COLS = ['規格', '牌價', '經銷價', '說明', '訂購品(V)']
+PRICE_COLS = ['牌價', '經銷價']
+# 重複值很多的欄位存成 categorical，其餘文字欄位用 Arrow 字串
+CATEGORY_COLS = ['訂購品(V)', '來源檔案', '來源分頁']
+PAGE_SIZE = 100       # 每頁顯示筆數；只有目前這頁會套用樣式並送到瀏覽器
+MAX_RESULTS = 2000    # 可翻頁瀏覽的最大筆數，超過時提示使用者縮小搜尋範圍
+# 整套搭配：data_merger 合併時已算好合計 (Bundles 分頁 / 牌價檔的 bundles 表)，這裡只載入與搜尋
+BUNDLE_SHEET = 'Bundles'
+BUNDLE_TABLE = 'bundles'
+BUNDLE_SNAPSHOT_FILE = 'bundles_snapshot.arrow'
+BUNDLE_SEARCH_COLS = ['系列', '組合', '組件']
+BUNDLE_CODE_COLS = ['組合', '組件']
+BUNDLE_DISPLAY_COLS = ['系列', '組合', '組件', '牌價', '經銷價', '缺少型號']
+# 管理員 Email：側邊欄會多一個效能統計面板
+ADMIN_EMAILS = [e.strip().lower() for e in st.secrets["admin_emails"]] if "admin_emails" in st.secrets else []
+# Prometheus textfile 輸出路徑 (給 node_exporter 的 textfile collector)；空字串則不輸出
+METRICS_TEXTFILE = st.secrets["metrics_textfile"] if "metrics_textfile" in st.secrets else ""
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+logger = logging.getLogger("app")
+
+try:
+    STRING_DTYPE = pd.StringDtype("pyarrow")
+except ImportError:  # 沒有 pyarrow 時退回一般的 str 物件欄位
+    STRING_DTYPE = str
 
 # === Session State 初始化 ===
 if 'logged_in' not in st.session_state:
@@ -72,35 +132,83 @@ if 'login_attempts' not in st.session_state:
     st.session_state.login_attempts = 0
 
 # === 連線函式 ===
+@st.cache_resource(ttl=CLIENT_TTL)
+@metrics.timed('get_client')
 def get_client():
+    """整個程序共用一個已授權的 gspread client，CLIENT_TTL 到期後重新授權"""
+    if LOCAL_SHEETS:
+        return LocalClient(LOCAL_SHEETS["path"], latency=float(LOCAL_SHEETS.get("latency", 0)))
     scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
     if "gcp_service_account" in st.secrets:
         creds_dict = dict(st.secrets["gcp_service_account"])
         creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
-        return gspread.authorize(creds)
     elif os.path.exists('service_account.json'):
         creds = ServiceAccountCredentials.from_json_keyfile_name('service_account.json', scope)
-        return gspread.authorize(creds)
     else:
         return None
+    client = gspread.authorize(creds)
+    # gspread 5 放在 client.session，gspread 6 放在 client.http_client.session
+    session = getattr(getattr(client, 'http_client', client), 'session', None)
+    if session is not None:
+        adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+        session.mount('https://', adapter)
+    return client
+
+@st.cache_resource
+def get_spreadsheet_key():
+    """試算表 ID：優先用 secrets 設定，否則以名稱開啟一次後記住"""
+    if GOOGLE_SHEET_KEY: return GOOGLE_SHEET_KEY
+    client = get_client()
+    if not client: return ""
+    with metrics.span('open'):
+        return client.open(GOOGLE_SHEET_NAME).id
+
+@st.cache_resource(ttl=CLIENT_TTL)
+def get_spreadsheet():
+    client = get_client()
+    if not client: return None
+    key = get_spreadsheet_key()
+    with metrics.span('open'):
+        return client.open_by_key(key)
+
+@st.cache_resource(ttl=CLIENT_TTL)
+def get_worksheet(title=None):
+    """快取的分頁物件；title 為 None 時回傳第一頁 (牌價資料庫)"""
+    sh = get_spreadsheet()
+    if not sh: return None
+    return sh.sheet1 if title is None else sh.worksheet(title)
 
 # === 資安與工具函式 ===
 def get_tw_time():
     tw_tz = timezone(timedelta(hours=8))
     return datetime.now(tw_tz).strftime("%Y-%m-%d %H:%M:%S")
 
+@st.cache_resource
+def get_log_writer():
+    return LogWriter(flush_interval=LOG_FLUSH_INTERVAL, batch_size=LOG_BATCH_SIZE,
+                     spill_path=LOG_SPILL_FILE)
+
+def bind_log(action, user_email, note=""):
+    """
+    先在 script thread 取好 Logs 分頁與 LogWriter，回傳之後再呼叫的寫入函式
+    (給背景執行緒用，例如寄信成功後才寫紀錄)
+    """
+    try:
+        ws = get_worksheet("Logs")
+        if not ws: return lambda: None
+        writer = get_log_writer()
+    except Exception:
+        logger.exception("無法取得 Logs 分頁")
+        return lambda: None
+    return lambda: writer.submit(ws, [get_tw_time(), user_email, action, note])
+
 def write_log(action, user_email, note=""):
-    client = get_client()
-    if not client: return
+    """排入背景佇列後立即返回，實際寫入由 LogWriter 批次處理"""
     try:
-        sh = client.open(GOOGLE_SHEET_NAME)
-        try:
-            ws = sh.worksheet("Logs")
-        except:
-            return 
-        ws.append_row([get_tw_time(), user_email, action, note])
-    except:
-        pass
+        with metrics.span('write_log'):
+            bind_log(action, user_email, note)()
+    except Exception:
+        logger.exception("寫入紀錄失敗: %s", action)
 
 def get_greeting():
     tw_tz = timezone(timedelta(hours=8))
@@ -114,21 +222,29 @@ def get_greeting():
     else:
         return "夜深了，不要太累了 ☕"
 
+@st.cache_resource
+def get_password_hasher():
+    return PasswordHasher(rounds=BCRYPT_ROUNDS, workers=BCRYPT_WORKERS)
+
 def check_password(plain_text, hashed_text):
-    try:
-        return bcrypt.checkpw(plain_text.encode('utf-8'), hashed_text.encode('utf-8'))
-    except: return False
+    return get_password_hasher().check(plain_text, hashed_text)
 
 def hash_password(plain_text):
-    return bcrypt.hashpw(plain_text.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    return get_password_hasher().hash(plain_text)
 
 def generate_random_password(length=8):
     chars = string.ascii_letters + string.digits
     return ''.join(random.choice(chars) for i in range(length))
 
-def send_reset_email(to_email, new_password):
-    if not SMTP_EMAIL or not SMTP_PASSWORD: 
-        return False, "系統未設定寄信信箱。"
+@st.cache_resource
+def get_mailer():
+    """整個程序共用的寄信佇列與 SMTP 連線"""
+    return MailDispatcher(SMTP_HOST, SMTP_PORT, SMTP_EMAIL, SMTP_PASSWORD, use_tls=SMTP_STARTTLS)
+
+def send_reset_email(to_email, new_password, on_sent=None):
+    """把重置信排入寄送佇列，回傳 (是否受理, 訊息, job id)；寄出後才呼叫 on_sent"""
+    if not SMTP_EMAIL or (not SMTP_PASSWORD and SMTP_STARTTLS): 
+        return False, "系統未設定寄信信箱。", None
         
     subject = "【士林電機FA】密碼重置通知"
     body = f"""
@@ -142,113 +258,354 @@ def send_reset_email(to_email, new_password):
     msg['From'] = SMTP_EMAIL
     msg['To'] = to_email
 
-    try:
-        with smtplib.SMTP('smtp.gmail.com', 587) as smtp:
-            smtp.ehlo()
-            smtp.starttls()
-            smtp.login(SMTP_EMAIL, SMTP_PASSWORD)
-            smtp.send_message(msg)
-        return True, "信件發送成功"
-    except Exception as e:
-        return False, "寄信失敗，請稍後再試。"
+    job_id = get_mailer().submit(msg, on_sent)
+    if job_id is None:
+        return False, "寄信失敗，請稍後再試。", None
+    return True, "信件已排入寄送", job_id
 
 # === [新增] 讀取更新日期函式 ===
+def read_update_date(ws):
+    """讀取 Users 分頁 D1 儲存格 (Row 1, Col 4) 的日期，沒有資料回傳空字串"""
+    if not ws: return ""
+    date_val = ws.cell(1, 4).value
+    return str(date_val) if date_val else ""
+
+@st.cache_resource
+def get_shared_cache():
+    return SharedCache(SHARED_CACHE_DIR)
+
+def read_shared_update_date(ws, shared=None):
+    """
+    經由主機共用快取讀取 Users!D1：所有 worker 合計每 CATALOG_CHECK_INTERVAL 秒最多讀一次
+    (背景執行緒呼叫時 shared 要先在 script thread 取好)
+    """
+    if not ws: return ""
+    shared = shared or get_shared_cache()
+    return shared.get('update_date', CATALOG_CHECK_INTERVAL, lambda: read_update_date(ws))[0]
+
 @st.cache_data(ttl=600)
 def get_update_date():
     """讀取 Users 分頁 D1 儲存格的日期"""
-    client = get_client()
-    if not client: return ""
+    metrics.miss()
     try:
-        sh = client.open(GOOGLE_SHEET_NAME)
-        ws = sh.worksheet("Users")
-        # 讀取 D1 儲存格 (Row 1, Col 4)
-        date_val = ws.cell(1, 4).value
-        return date_val if date_val else "未知"
-    except:
+        ws = get_worksheet("Users")
+        if not ws: return ""
+        return read_shared_update_date(ws) or "未知"
+    except Exception:
+        logger.exception("讀取更新日期失敗")
         return "未知"
 
+# === 帳號索引 ===
+@st.cache_resource
+def get_user_directory():
+    return UserDirectory(ttl=USER_CACHE_TTL)
+
+def fetch_users(ws):
+    with metrics.span('users_get_all_values'):
+        return ws.get_all_values()
+
+def lookup_user(ws, email):
+    """
+    回傳 (列號, 密碼雜湊, 姓名)，查無此帳號回傳 None；只有索引過期或其他 worker 改過密碼
+    (共用快取 users 失效) 時才重新載入，且優先採用主機共用快取中其他 worker 剛讀過的 Users
+    """
+    directory = get_user_directory()
+    shared = get_shared_cache()
+    refresh = directory.needs_refresh(email, shared.invalidated_at('users'))
+    metrics.cache('user_directory', hit=not refresh)
+    if refresh:
+        # 查不到的 email 只接受 miss_refresh 秒內讀取的資料，新帳號不用等滿 ttl
+        ttl = directory.ttl if directory.get(email) else directory.miss_refresh
+        values, fetched_at = shared.get('users', ttl, lambda: fetch_users(ws))
+        directory.load(values, fetched_at)
+    return directory.get(email)
+
+def save_password(ws, email, row, hashed, directory=None, shared=None):
+    """寫入新密碼雜湊，同步更新記憶體中的帳號索引，並讓其他 worker 的共用快取失效"""
+    directory = directory or get_user_directory()
+    shared = shared or get_shared_cache()
+    ws.update_cell(row, directory.password_col, hashed)
+    directory.set_password(email, hashed)
+    shared.invalidate('users')
+
 # === 業務邏輯 ===
 def login(email, password):
-    client = get_client()
-    if not client: return False, "連線失敗"
     try:
-        sh = client.open(GOOGLE_SHEET_NAME)
-        ws = sh.worksheet("Users")
-        users = ws.get_all_records()
+        ws = get_worksheet("Users")
+        if not ws: return False, "連線失敗"
+        user = lookup_user(ws, email)
         
-        for user in users:
-            if str(user.get('email')).strip() == email.strip():
-                if check_password(password, str(user.get('password'))):
-                    found_name = str(user.get('name')) if user.get('name') else email
-                    write_log("登入成功", email)
-                    return True, found_name
-                else:
-                    write_log("登入失敗", email, "密碼錯誤")
-                    return False, "密碼錯誤"
+        if user:
+            row, hashed, name = user
+            if check_password(password, hashed):
+                found_name = name if name else email
+                if get_password_hasher().needs_rehash(hashed):
+                    try:
+                        save_password(ws, email, row, hash_password(password))
+                    except Exception:
+                        logger.exception("重新雜湊密碼失敗: %s", email)
+                write_log("登入成功", email)
+                return True, found_name
+            else:
+                write_log("登入失敗", email, "密碼錯誤")
+                return False, "密碼錯誤"
         
         write_log("登入失敗", email, "帳號不存在")
         return False, "此 Email 尚未註冊"
-    except Exception as e:
+    except Exception:
+        logger.exception("登入過程錯誤: %s", email)
         return False, "登入過程錯誤"
 
 def change_password(email, new_password):
-    client = get_client()
-    if not client: return False
     try:
-        sh = client.open(GOOGLE_SHEET_NAME)
-        ws = sh.worksheet("Users")
-        cell = ws.find(email)
-        if cell:
+        ws = get_worksheet("Users")
+        if not ws: return False
+        user = lookup_user(ws, email)
+        if user:
             safe_pwd = hash_password(new_password)
-            ws.update_cell(cell.row, 2, safe_pwd)
+            save_password(ws, email, user[0], safe_pwd)
             write_log("修改密碼", email, "使用者自行修改")
             return True
         return False
-    except: return False
+    except Exception:
+        logger.exception("修改密碼失敗: %s", email)
+        return False
 
 def reset_password_flow(target_email):
-    client = get_client()
-    if not client: return False, "連線失敗"
+    """
+    回傳 (是否受理, 訊息, 寄信 job id)。信件在背景寄送，
+    寄出成功後才寫入新密碼，寄信失敗時舊密碼維持有效
+    """
     try:
-        sh = client.open(GOOGLE_SHEET_NAME)
-        ws = sh.worksheet("Users")
-        try:
-            cell = ws.find(target_email.strip())
-        except gspread.exceptions.CellNotFound:
-             return False, "此 Email 尚未註冊"
+        ws = get_worksheet("Users")
+        if not ws: return False, "連線失敗", None
+        user = lookup_user(ws, target_email)
+        if not user:
+             return False, "此 Email 尚未註冊", None
         
         new_pw = generate_random_password()
-        sent, msg = send_reset_email(target_email, new_pw)
+        hashed = hash_password(new_pw)
+        # 背景執行緒用到的物件都先在這裡取好
+        directory = get_user_directory()
+        shared = get_shared_cache()
+        log = bind_log("重置密碼", target_email, "忘記密碼重置")
+
+        def on_sent():
+            save_password(ws, target_email, user[0], hashed, directory, shared)
+            log()
+
+        sent, msg, job_id = send_reset_email(target_email, new_pw, on_sent)
         if not sent:
-            return False, msg
-            
-        ws.update_cell(cell.row, 2, hash_password(new_pw))
-        write_log("重置密碼", target_email, "忘記密碼重置")
-        return True, "重置成功！新密碼已寄送到您的信箱。"
-    except Exception as e:
-        return False, "重置失敗"
+            return False, msg, None
+        return True, "已受理重置申請，新密碼將寄送到您的信箱。", job_id
+    except Exception:
+        logger.exception("重置密碼失敗: %s", target_email)
+        return False, "重置失敗", None
 
-@st.cache_data(ttl=600)
-def load_data():
-    client = get_client()
-    if not client: return pd.DataFrame()
+def poll_reset_status():
+    """
+    以 fragment 每 2 秒查詢重置信的寄送進度；寄送結束 (或 job 已不在紀錄中) 時
+    把結果存進 reset_status、清掉 reset_job 並整頁重跑，fragment 就不再定時執行
+    """
+    status = get_mailer().status(st.session_state.get('reset_job'))
+    if status in (MailDispatcher.QUEUED, MailDispatcher.SENDING):
+        st.info("📨 信件寄送中，請稍候...")
+        return
+    st.session_state.reset_job = None
+    st.session_state.reset_status = status
+    st.rerun()
+
+def show_reset_status(status):
+    """顯示最近一次重置信的寄送結果"""
+    if status == MailDispatcher.SENT:
+        st.success("重置成功！新密碼已寄送到您的信箱。")
+    elif status == MailDispatcher.FAILED:
+        st.error("寄信失敗，請稍後再試。")
+    elif status == MailDispatcher.CALLBACK_FAILED:
+        st.error("重置失敗，信中的新密碼無法使用，請稍後再試。")
+
+@metrics.timed('load_data')
+def load_data(ws):
+    """下載整張牌價表；快取與更新時機由 CatalogCache 控制"""
+    try:
+        if not ws: return pd.DataFrame()
+        with metrics.span('get_all_records'):
+            data = ws.get_all_records()
+        return compact_catalog(pd.DataFrame(data))
+    except Exception:
+        logger.exception("下載牌價表失敗")
+        return pd.DataFrame()
+
+def compact_catalog(df):
+    """
+    轉成精簡的欄位型別：價格為 float (只在載入時轉換一次)、CATEGORY_COLS 為 categorical、其餘為 Arrow 字串
+    每個 worker 各自常駐一份牌價表，另外還有 SearchIndex 與 get_result_view 的結果快取
+    """
+    for col in df.columns:
+        if col in PRICE_COLS:
+            df[col] = clean_currency(df[col])
+        elif col in CATEGORY_COLS:
+            df[col] = df[col].astype(str).astype('category')
+        else:
+            df[col] = df[col].astype(STRING_DTYPE)
+    return df
+
+def build_catalog(df):
+    """牌價表 + 搜尋索引，每次資料重新整理只建立一次，同一個 worker 的所有使用者共用"""
+    return df, build_search_index(df, SEARCH_COLS, CODE_COLS)
+
+@st.cache_resource
+def get_catalog_cache():
+    return CatalogCache(build_catalog, check_interval=CATALOG_CHECK_INTERVAL,
+                        max_age=CATALOG_MAX_AGE,
+                        store=CatalogSnapshot(CATALOG_SNAPSHOT_FILE))
+
+def build_bundle_catalog(df):
+    """整套搭配 + 搜尋索引 (與牌價表相同的 SearchIndex)，每次重新載入只建立一次"""
+    return df, build_search_index(df, BUNDLE_SEARCH_COLS, BUNDLE_CODE_COLS)
+
+@st.cache_resource
+def get_bundle_cache():
+    return CatalogCache(build_bundle_catalog, check_interval=CATALOG_CHECK_INTERVAL,
+                        max_age=CATALOG_MAX_AGE,
+                        store=CatalogSnapshot(BUNDLE_SNAPSHOT_FILE))
+
+@st.cache_resource
+def get_catalog_db():
+    return CatalogDB(CATALOG_DB)
+
+@st.cache_resource
+def get_bundle_db():
+    return CatalogDB(CATALOG_DB, table=BUNDLE_TABLE)
+
+def get_catalog():
+    """
+    回傳 (df, index, version)；過期時在背景更新，這次先回傳舊資料
+    設定 CATALOG_DB 時 df 為 CatalogDB (查詢在 SQLite 內進行)，index 為 None
+    """
+    if CATALOG_DB:
+        try:
+            db = get_catalog_db()
+            return db, None, db.version
+        except Exception:
+            logger.exception("無法開啟牌價檔: %s", CATALOG_DB)
+            return pd.DataFrame(), None, ""
+    # 分頁物件在這裡 (script thread) 取好，背景執行緒只做網路讀取
+    try:
+        users_ws, catalog_ws = get_worksheet("Users"), get_worksheet()
+    except Exception:
+        logger.exception("無法取得牌價表分頁")
+        users_ws = catalog_ws = None
+    shared = get_shared_cache()
+    return get_catalog_cache().get(lambda: read_shared_update_date(users_ws, shared),
+                                   lambda: load_data(catalog_ws))
+
+def get_bundles():
+    """回傳整套搭配的 (df, index, version)，快取與版本判斷方式同 get_catalog()"""
+    if CATALOG_DB:
+        try:
+            db = get_bundle_db()
+            return db, None, db.version
+        except Exception:
+            logger.exception("無法開啟牌價檔: %s", CATALOG_DB)
+            return pd.DataFrame(), None, ""
+    try:
+        users_ws = get_worksheet("Users")
+    except Exception:
+        logger.exception("無法取得 Users 分頁")
+        users_ws = None
     try:
-        sh = client.open(GOOGLE_SHEET_NAME)
-        data = sh.sheet1.get_all_records()
-        return pd.DataFrame(data).astype(str)
-    except: return pd.DataFrame()
-
-def clean_currency(val):
-    if not val or pd.isna(val): return None
-    val_str = str(val)
-    clean_str = re.sub(r'[^\d.]', '', val_str)
-    try: return float(clean_str)
-    except ValueError: return None
+        bundle_ws = get_worksheet(BUNDLE_SHEET)
+    except gspread.exceptions.WorksheetNotFound:
+        bundle_ws = None  # 還沒有執行過新版 data_merger
+    except Exception:
+        logger.exception("無法取得整套搭配分頁")
+        bundle_ws = None
+    shared = get_shared_cache()
+    return get_bundle_cache().get(lambda: read_shared_update_date(users_ws, shared),
+                                  lambda: load_data(bundle_ws))
+
+@metrics.timed('clean_currency')
+def clean_currency(series):
+    """把 $12,000 之類的文字價格整欄轉成 float，無法轉換的變成 NaN"""
+    clean = series.astype(str).str.replace(r'[^\d.]', '', regex=True)
+    return pd.to_numeric(clean, errors='coerce').astype('float64')
+
+@st.cache_resource(ttl=600, max_entries=256)
+def get_result_view(search_term, version, columns, _df, _index):
+    """
+    依 (資料版本, 顯示欄位, 關鍵字) 快取搜尋結果的前 MAX_RESULTS 筆 (只含 columns 欄位)，回傳 (結果, 符合總筆數)；
+    查無資料回傳 (None, 0)。單品與整套搭配以 columns 區分
+    """
+    metrics.miss()
+    if isinstance(_df, CatalogDB):
+        # SQLite 後端：在資料庫內搜尋，只取回可瀏覽的前 MAX_RESULTS 筆
+        with metrics.span('search'):
+            display_df, total = _df.search(search_term, columns, MAX_RESULTS)
+    else:
+        # 與 SQLite 後端相同，只快取可瀏覽的前 MAX_RESULTS 筆 (空白或單一字的查詢幾乎是整張表)
+        display_df, total = _df.iloc[:MAX_RESULTS], len(_df)
+        if search_term:
+            # 透過預先建立的索引搜尋 NO. / 規格 / 說明 (字面比對，不當作 regex)
+            with metrics.span('search'):
+                positions = _index.search(search_term)
+            # 有輸入關鍵字時一律只取命中的列，不會退回「全部資料」
+            if positions is None: positions = []
+            display_df, total = _df.iloc[positions[:MAX_RESULTS]], len(positions)
+
+    final_cols = [c for c in columns if c in display_df.columns]
+    if display_df.empty or not final_cols: return None, 0
+    return display_df[final_cols], total
+
+@st.cache_resource(ttl=600, max_entries=1024)
+@metrics.timed('styler')
+def get_page_styler(search_term, version, columns, page, _final_df):
+    """只對第 page 頁 (從 1 開始) 的資料建立表格樣式"""
+    metrics.miss()
+    start = (page - 1) * PAGE_SIZE
+    final_df = _final_df.iloc[start:start + PAGE_SIZE]
+    price_cols = [c for c in PRICE_COLS if c in final_df.columns]
+
+    styler = final_df.style.format("{:,.0f}", subset=price_cols, na_rep="")
+    styler = styler.set_properties(**{'font-size': '18px'})
+    styler = styler.set_properties(subset=price_cols, **{'text-align': 'right'})
+    
+    if '訂購品(V)' in final_df.columns:
+        styler = styler.set_properties(subset=['訂購品(V)'], **{'text-align': 'center'})
+
+    styler = styler.set_table_styles([
+        {'selector': 'th', 'props': [('text-align', 'center')]}
+    ])
+    return styler
+
+@st.cache_resource
+def start_metrics_export():
+    """每個程序只啟動一次 Prometheus textfile 輸出"""
+    if not METRICS_TEXTFILE: return None
+    return metrics.start_export(METRICS_TEXTFILE)
+
+def show_metrics_panel():
+    """管理員用：各段耗時的 p50 / p95 與快取命中率 (本程序啟動以來)"""
+    spans, caches = metrics.summary()
+    if spans:
+        st.dataframe(pd.DataFrame([
+            {'項目': name, '次數': s['count'], 'p50 (ms)': round(s['p50'] * 1000, 1),
+             'p95 (ms)': round(s['p95'] * 1000, 1)}
+            for name, s in spans.items()
+        ]), hide_index=True)
+    if caches:
+        st.dataframe(pd.DataFrame([
+            {'快取': name, '查詢': c['requests'], '命中率': f"{c['hit_ratio']:.0%}"}
+            for name, c in caches.items()
+        ]), hide_index=True)
+    st.download_button("下載 Prometheus 格式", metrics.prometheus_text(),
+                       file_name="metrics.prom", mime="text/plain")
 
 # ==========================================
 #               主程式
 # ==========================================
 def main_app():
+    start_metrics_export()
     if not st.session_state.logged_in:
         col1, col2, col3 = st.columns([1, 2, 1])
         with col2:
@@ -293,13 +650,17 @@ def main_app():
                     if reset_submit:
                         if reset_email:
                             with st.spinner("系統處理中，請稍候..."):
-                                success, msg = reset_password_flow(reset_email)
-                                if success:
-                                    st.success(msg)
-                                else:
+                                success, msg, job_id = reset_password_flow(reset_email)
+                                st.session_state.reset_job = job_id
+                                st.session_state.reset_status = None
+                                if not success:
                                     st.error(msg)
                         else:
                             st.warning("請輸入 Email")
+                if st.session_state.get('reset_job'):
+                    st.fragment(poll_reset_status, run_every=2)()
+                elif st.session_state.get('reset_status'):
+                    show_reset_status(st.session_state.reset_status)
         return
 
     # --- 側邊欄 ---
@@ -317,6 +678,10 @@ def main_app():
                         st.error("修改失敗")
                 else:
                     st.warning("密碼不能為空")
+
+        if st.session_state.user_email.strip().lower() in ADMIN_EMAILS:
+            with st.expander("📊 效能統計"):
+                show_metrics_panel()
         
         st.markdown("---")
         if st.button("登出", use_container_width=True):
@@ -331,55 +696,59 @@ def main_app():
     st.title("🔍 士林電機FA 2026年經銷牌價查詢系統")
     
     # 2. [新增] 顯示資料庫更新日期 (讀取 Users D1)
-    update_date = get_update_date()
+    with metrics.lookup('update_date'):
+        update_date = get_update_date()
     if update_date:
         st.caption(f"📅 資料庫最後更新：{update_date}")
     
     st.markdown("---")
 
-    df = load_data()
+    mode = st.radio("查詢模式", ["單品", "整套搭配"], horizontal=True, label_visibility="collapsed")
+    if mode == "整套搭配":
+        df, index, version = get_bundles()
+        columns = tuple(BUNDLE_DISPLAY_COLS)
+    else:
+        df, index, version = get_catalog()
+        columns = tuple(DISPLAY_COLS)
 
     if not df.empty:
         search_term = st.text_input("輸入關鍵字搜尋", "", placeholder="例如: FX5U / SDC / 馬達")
+        search_term = search_term.strip()
+        with metrics.lookup('result_view'):
+            final_df, count = get_result_view(search_term, version, columns, df, index)
         
-        # [修改] 移除所有複雜邏輯，只保留最單純的字串搜尋
-        display_df = df.copy()
-        if search_term:
-            # 簡單暴力的搜尋：只要 NO. / 規格 / 說明 裡面有這個字，就抓出來
-            valid_search = [c for c in SEARCH_COLS if c in display_df.columns]
-            mask = display_df[valid_search].apply(lambda x: x.str.contains(search_term, case=False, na=False)).any(axis=1)
-            display_df = display_df[mask]
-
-        final_cols = [c for c in DISPLAY_COLS if c in display_df.columns]
-        
-        if not display_df.empty and final_cols:
-            final_df = display_df[final_cols].copy()
-            for col in ['牌價', '經銷價']:
-                if col in final_df.columns:
-                    final_df[col] = final_df[col].apply(clean_currency)
-
-            st.info(f"搜尋結果：共 {len(final_df)} 筆")
-            
-            styler = final_df.style.format("{:,.0f}", subset=['牌價', '經銷價'], na_rep="")
-            styler = styler.set_properties(**{'font-size': '18px'})
-            styler = styler.set_properties(subset=['牌價', '經銷價'], **{'text-align': 'right'})
-            
-            if '訂購品(V)' in final_df.columns:
-                styler = styler.set_properties(subset=['訂購品(V)'], **{'text-align': 'center'})
-
-            styler = styler.set_table_styles([
-                {'selector': 'th', 'props': [('text-align', 'center')]}
-            ])
-
-            st.dataframe(styler, use_container_width=True, hide_index=True, height=600)
+        if final_df is not None:
+            if count > MAX_RESULTS:
+                st.info(f"搜尋結果：共 {count} 筆，僅列出前 {MAX_RESULTS} 筆，請輸入更精確的關鍵字縮小範圍")
+            else:
+                st.info(f"搜尋結果：共 {count} 筆")
+
+            # 換關鍵字或查詢模式時回到第一頁
+            if st.session_state.get('last_search') != (mode, search_term):
+                st.session_state.last_search = (mode, search_term)
+                st.session_state.result_page = 1
+            total_pages = max((min(count, MAX_RESULTS) - 1) // PAGE_SIZE + 1, 1)
+            page = min(st.session_state.get('result_page', 1), total_pages)
+
+            with metrics.lookup('page_styler'):
+                styler = get_page_styler(search_term, version, columns, page, final_df)
+            with metrics.span('render'):
+                st.dataframe(styler, use_container_width=True, hide_index=True, height=600)
+
+            if total_pages > 1:
+                st.number_input(f"頁數 (共 {total_pages} 頁，每頁 {PAGE_SIZE} 筆)",
+                                min_value=1, max_value=total_pages, step=1, key='result_page')
         else:
             if search_term:
                 st.warning("查無資料")
+    elif mode == "整套搭配":
+        st.info("目前沒有整套搭配資料。")
     else:
         st.error("資料庫連線異常，請稍後再試。")
 
 if __name__ == "__main__":
     try:
         main_app()
-    except Exception as e:
+    except Exception:
+        logger.exception("main_app 發生錯誤")
         st.error("系統暫時忙碌中，請重新整理或聯繫管理員。")
\ No newline at end of file
@@ -0,0 +1,283 @@
+"""
+查詢系統效能測試：以 local_sheets (SQLite 模擬的試算表) 取代 Google Sheets，
+用 Streamlit AppTest 量測冷啟動、登入、搜尋與多人同時使用的延遲。
+
+    python benchmarks/bench_app.py --sizes 10000,100000,1000000 --output bench.json
+    python benchmarks/bench_app.py --sizes 10000 --baseline bench.json   # 與上次結果比較
+
+結果 JSON 帶有 git commit，可在不同版本間比較 (同一台機器、相同參數)。
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pandas as pd  # noqa: E402
+import streamlit as st  # noqa: E402
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+from catalog_db import write_catalog_db  # noqa: E402
+from local_sheets import LocalClient, seed_spreadsheet  # noqa: E402
+from passwords import hash_password  # noqa: E402
+
+APP_FILE = os.path.join(ROOT, 'app.py')
+SHEET_NAME = '經銷牌價表_資料庫'
+PASSWORD = 'bench-pw'
+FAMILIES = ['FX5U', 'FX3U', 'SDC', 'MR-J4', 'NV-S', 'HF-KP', 'Q03UDV', 'GOT2000']
+DESCRIPTIONS = ['伺服馬達', '控制器', '無熔絲斷路器', '人機介面', '變頻器', '電磁開關']
+QUERIES = ['FX5U', '馬達', 'MR-J4-00', 'sdc-0001', '斷路器', 'ZZZ-不存在']
+
+
+def catalog_values(rows):
+    rnd = random.Random(rows)
+    values = [['NO.', '規格', '牌價', '經銷價', '說明', '訂購品(V)', '來源檔案', '來源分頁']]
+    for i in range(rows):
+        price = rnd.randrange(1000, 500000, 100)
+        values.append([
+            str(i + 1),
+            f"{FAMILIES[i % len(FAMILIES)]}-{i:06d}",
+            f"${price:,}",
+            f"{int(price * 0.8):,}",
+            DESCRIPTIONS[rnd.randrange(len(DESCRIPTIONS))],
+            'V' if i % 5 == 0 else '',
+            f"牌價_{i % 20:02d}.xlsx",
+            f"系列{i % 7}",
+        ])
+    return values
+
+
+def seed(path, rows, users, rounds, catalog_db=""):
+    """建立一份含牌價表、Users、Logs 的 SQLite 試算表；給 catalog_db 時另外寫出 SQLite 牌價檔"""
+    hashed = hash_password(PASSWORD, rounds)
+    catalog = catalog_values(rows)
+    if catalog_db:
+        write_catalog_db(catalog_db, pd.DataFrame(catalog[1:], columns=catalog[0]),
+                         ['NO.', '規格', '說明'], ['NO.', '規格'], ['牌價', '經銷價'], version='bench')
+    sheets = {
+        '牌價資料庫': catalog,
+        'Users': [['email', 'password', 'name', '2026-01-01']]
+                 + [[f"user{i}@example.com", hashed, f"使用者{i}"] for i in range(users)],
+        'Logs': [['時間', 'Email', '動作', '備註']],
+    }
+    seed_spreadsheet(LocalClient(path), SHEET_NAME, sheets)
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    if not samples: return {}
+    return {
+        'n': len(samples),
+        'mean': statistics.fmean(samples),
+        'p50': samples[len(samples) // 2],
+        'p95': samples[min(int(len(samples) * 0.95), len(samples) - 1)],
+        'max': samples[-1],
+    }
+
+
+class Session:
+    """一個瀏覽器分頁 (AppTest)；每個動作回傳重新執行腳本的秒數"""
+
+    def __init__(self, db_path, args):
+        self.at = AppTest.from_file(APP_FILE, default_timeout=600)
+        self.at.secrets.update(app_secrets(db_path, args))
+
+    def _run(self):
+        start = time.perf_counter()
+        self.at.run()
+        elapsed = time.perf_counter() - start
+        if self.at.exception or self.at.error:
+            errors = [e.value for e in self.at.exception] + [e.value for e in self.at.error]
+            raise RuntimeError(f"app error: {errors}")
+        return elapsed
+
+    def open(self):
+        return self._run()
+
+    def login(self, email):
+        [t for t in self.at.text_input if t.label == 'Email'][0].input(email)
+        [t for t in self.at.text_input if t.label == '密碼'][0].input(PASSWORD)
+        [b for b in self.at.button if b.label == '登入'][0].click()
+        elapsed = self._run()  # 送出表單 (驗證密碼)
+        return elapsed + self._run()  # st.rerun() 後畫出查詢頁
+
+    def search(self, query):
+        [t for t in self.at.text_input if t.label == '輸入關鍵字搜尋'][0].input(query)
+        return self._run()
+
+
+def app_secrets(db_path, args):
+    secrets = {
+        'local_sheets': {'path': db_path, 'latency': args.latency},
+        'bcrypt_rounds': args.rounds,
+    }
+    if args.catalog_db:
+        secrets['catalog_db'] = catalog_db_path(db_path)
+    return secrets
+
+
+def catalog_db_path(db_path):
+    return db_path.replace('.db', '_catalog.db')
+
+
+def clear_caches():
+    st.cache_resource.clear()
+    st.cache_data.clear()
+
+
+def bench_size(db_path, args):
+    result = {}
+    clear_caches()
+
+    # 冷啟動：清空快取、本機快照與主機共用快取後，第一位使用者從開頁到看到查詢頁
+    for name in os.listdir('.'):
+        if name.startswith(('catalog_snapshot', 'bundles_snapshot')): os.remove(name)
+    shutil.rmtree('.shared_cache', ignore_errors=True)
+    session = Session(db_path, args)
+    open_s = session.open()
+    login_s = session.login('user0@example.com')
+    result['cold_start'] = summarize([open_s + login_s])
+
+    # 搜尋 (已登入、資料已載入)：每個關鍵字第一次 (未命中結果快取) 與重複查詢
+    first, repeat = [], []
+    for query in QUERIES:
+        first.append(session.search(query))
+    for _ in range(args.repeat):
+        for query in QUERIES:
+            repeat.append(session.search(query))
+    result['search_first'] = summarize(first)
+    result['search_repeat'] = summarize(repeat)
+
+    # 登入 (資料已載入)：每次都是新的 session
+    logins = []
+    for i in range(args.logins):
+        session = Session(db_path, args)
+        session.open()
+        logins.append(session.login(f"user{(i + 1) % args.users}@example.com"))
+    result['login'] = summarize(logins)
+
+    # 多人同時使用：AppTest 會替換全域的 st.secrets / session state (也會換掉 __main__)，
+    # 不能在同一個程序內同時執行，所以每個 session 各開一個子程序 (--worker)，共用同一份模擬試算表
+    samples, errors = {'login': [], 'search': []}, []
+    start = time.perf_counter()
+    procs = [subprocess.Popen(worker_command(db_path, args, n), stdout=subprocess.PIPE,
+                              stderr=subprocess.PIPE, text=True)
+             for n in range(args.sessions)]
+    for proc in procs:
+        out, err = proc.communicate()
+        if proc.returncode == 0:
+            found = json.loads(out.strip().splitlines()[-1])
+            samples['login'].append(found['login'])
+            samples['search'].extend(found['search'])
+        else:
+            errors.append((err.strip().splitlines() or [f"exit {proc.returncode}"])[-1])
+    wall = time.perf_counter() - start
+    result['concurrent_login'] = summarize(samples['login'])
+    result['concurrent_search'] = summarize(samples['search'])
+    result['concurrent_wall'] = summarize([wall])
+    if errors:
+        result['concurrent_errors'] = errors[:5]
+    return result
+
+
+def worker_command(db_path, args, n):
+    cmd = [sys.executable, os.path.abspath(__file__), '--worker', str(n), '--worker-db', db_path,
+           '--users', str(args.users), '--rounds', str(args.rounds), '--latency', str(args.latency)]
+    return cmd + (['--catalog-db'] if args.catalog_db else [])
+
+
+def concurrent_session(db_path, args, n):
+    """子程序 (--worker) 執行：開頁、登入、依亂數順序查詢，最後一行印出 JSON 秒數"""
+    s = Session(db_path, args)
+    s.open()
+    login_s = s.login(f"user{n % args.users}@example.com")
+    search_s = [s.search(q) for q in random.Random(n).sample(QUERIES, len(QUERIES))]
+    print(json.dumps({'login': login_s, 'search': search_s}), flush=True)
+
+
+def git_commit():
+    try:
+        out = subprocess.run(['git', '-C', ROOT, 'rev-parse', '--short', 'HEAD'],
+                             capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', '-C', ROOT, 'status', '--porcelain', '--untracked-files=no'],
+                               capture_output=True, text=True).stdout.strip()
+        return out + ('-dirty' if dirty else '')
+    except Exception:
+        return ''
+
+
+def print_report(report, baseline=None):
+    base = (baseline or {}).get('results', {})
+    print(f"\ncommit {report['commit']}" + (f"  vs  {baseline['commit']}" if baseline else ""))
+    print(f"{'資料量':>9} {'項目':<20}{'p50(ms)':>10}{'p95(ms)':>10}{'n':>5}" + ("  與基準比" if base else ""))
+    for size, scenarios in report['results'].items():
+        for name, stats in scenarios.items():
+            if not isinstance(stats, dict) or 'p50' not in stats: continue
+            line = f"{size:>9} {name:<20}{stats['p50'] * 1000:>10.1f}{stats['p95'] * 1000:>10.1f}{stats['n']:>5}"
+            old = base.get(size, {}).get(name)
+            if old and old.get('p50'):
+                line += f"  x{stats['p50'] / old['p50']:.2f}"
+            print(line)
+        for err in scenarios.get('concurrent_errors', []):
+            print(f"{size:>9} ❌ {err}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查詢系統效能測試 (本機模擬試算表 + AppTest)")
+    parser.add_argument('--sizes', default='10000,100000,1000000', help="牌價表筆數，以逗號分隔")
+    parser.add_argument('--users', type=int, default=200, help="Users 分頁的帳號數")
+    parser.add_argument('--rounds', type=int, default=12, help="bcrypt 成本參數")
+    parser.add_argument('--latency', type=float, default=0.0, help="模擬每次 API 呼叫的網路延遲 (秒)")
+    parser.add_argument('--logins', type=int, default=5, help="登入量測次數")
+    parser.add_argument('--repeat', type=int, default=3, help="重複查詢的輪數")
+    parser.add_argument('--sessions', type=int, default=8, help="同時使用的 session 數")
+    parser.add_argument('--catalog-db', action='store_true',
+                        help="牌價改用 SQLite 牌價檔 (data_merger --target sqlite) 查詢")
+    parser.add_argument('--output', help="結果寫入 JSON 檔")
+    parser.add_argument('--baseline', help="與先前輸出的 JSON 比較")
+    parser.add_argument('--worker', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--worker-db', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker is not None:
+        os.chdir(os.path.dirname(args.worker_db))
+        return concurrent_session(args.worker_db, args, args.worker)
+
+    report = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'params': {k: v for k, v in vars(args).items() if k not in ('output', 'baseline', 'worker', 'worker_db')},
+        'results': {},
+    }
+    with tempfile.TemporaryDirectory() as work:
+        os.chdir(work)  # 本機快照與 spill 檔寫在暫存目錄
+        for size in [int(s) for s in args.sizes.split(',') if s]:
+            db_path = os.path.join(work, f"sheets_{size}.db")
+            start = time.perf_counter()
+            seed(db_path, size, args.users, args.rounds, catalog_db_path(db_path) if args.catalog_db else "")
+            print(f"[{size}] 建立模擬試算表：{time.perf_counter() - start:.1f}s", flush=True)
+            report['results'][str(size)] = bench_size(db_path, args)
+        os.chdir(ROOT)
+        clear_caches()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
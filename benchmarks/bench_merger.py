@@ -0,0 +1,139 @@
+"""
+data_merger 解析效能比較：舊版 (每個分頁 read_excel 兩次 + iterrows 找標題列)
+與目前的 ingest_files (單次串流讀取 + 向量化標題判斷) 在同一組合成活頁簿上的耗時，
+並確認兩者產出的資料完全相同。
+
+    python benchmarks/bench_merger.py --rows 100000 --files 10 --workers 4
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+import openpyxl
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from data_merger import TARGET_COLUMNS, clean_header_name, ingest_files  # noqa: E402
+
+# 實際檔案常見的標題寫法 (空白、全形括號)
+HEADER_VARIANTS = [
+    ["NO.", "規格", "牌價", "經銷價", "說明", "訂購品(V)", "備註"],
+    ["NO.", "規 格", "牌 價", "經銷 價", "說明", "訂購品（V）", "備註"],
+    ["規格", "NO.", "經銷價", "說明", "備註"],
+]
+
+
+def make_workbooks(folder, total_rows, files, sheets):
+    """產生 files 個活頁簿、每本 sheets 個分頁，總資料列數約為 total_rows"""
+    rnd = random.Random(1)
+    per_sheet = max(total_rows // (files * sheets), 1)
+    paths = []
+    for f in range(files):
+        wb = openpyxl.Workbook()
+        wb.remove(wb.active)
+        for s in range(sheets):
+            ws = wb.create_sheet(f"系列{s}")
+            header = HEADER_VARIANTS[(f + s) % len(HEADER_VARIANTS)]
+            for _ in range(rnd.randint(0, 3)):
+                ws.append(["士林電機 經銷牌價表"])
+            ws.append(header)
+            for i in range(per_sheet):
+                row = {
+                    "NO.": i + 1,
+                    "規格": f"SE-{f}{s}-{i}",
+                    "牌價": 12000 + i,
+                    "經銷價": 9600.5 if i % 7 == 0 else float(9600 + i),
+                    "說明": "馬達" if i % 2 else None,
+                    "訂購品(V)": "V" if i % 5 == 0 else None,
+                    "備註": "",
+                }
+                ws.append([row[clean_header_name(h)] for h in header])
+            ws.append([None, None])
+        path = os.path.join(folder, f"bench_{f}.xlsx")
+        wb.save(path)
+        paths.append(path)
+    return paths
+
+
+def legacy_find_header_row(file_path, sheet_name):
+    try:
+        df_temp = pd.read_excel(file_path, sheet_name=sheet_name, header=None, nrows=20)
+        for idx, row in df_temp.iterrows():
+            row_str = "".join([clean_header_name(x) for x in row.values])
+            if '規格' in row_str and ('經銷價' in row_str or '牌價' in row_str):
+                return idx
+    except: pass
+    return 0
+
+
+def legacy_ingest(paths):
+    """舊版 process_general_files 的解析部分"""
+    all_data = []
+    for file_path in paths:
+        file = os.path.basename(file_path)
+        xls = pd.ExcelFile(file_path)
+        for sheet_name in xls.sheet_names:
+            header_idx = legacy_find_header_row(file_path, sheet_name)
+            df = pd.read_excel(file_path, sheet_name=sheet_name, header=header_idx, dtype=str)
+            df.columns = [clean_header_name(c) for c in df.columns]
+
+            clean_df = pd.DataFrame(columns=TARGET_COLUMNS)
+            for col in TARGET_COLUMNS:
+                if col in df.columns: clean_df[col] = df[col]
+                else: clean_df[col] = ""
+
+            clean_df = clean_df[clean_df['規格'].str.strip() != '']
+            if not clean_df.empty:
+                clean_df['來源檔案'] = file
+                clean_df['來源分頁'] = sheet_name
+                all_data.append(clean_df)
+    return pd.concat(all_data, ignore_index=True).fillna("")
+
+
+def current_ingest(paths, workers):
+    frames = []
+    for result in ingest_files(paths, workers):
+        if result['error']: raise RuntimeError(f"{result['file']}: {result['error']}")
+        if result['sheet_errors']: raise RuntimeError(f"{result['file']}: {result['sheet_errors']}")
+        frames.extend(result['frames'])
+    return pd.concat(frames, ignore_index=True).fillna("")
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比較 data_merger 新舊解析流程")
+    parser.add_argument('--rows', type=int, default=100000, help="合成資料總列數")
+    parser.add_argument('--files', type=int, default=10, help="活頁簿數量")
+    parser.add_argument('--sheets', type=int, default=3, help="每本活頁簿的分頁數")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="ingest_files 的程序數")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        start = time.perf_counter()
+        paths = make_workbooks(folder, args.rows, args.files, args.sheets)
+        print(f"產生 {len(paths)} 個活頁簿：{time.perf_counter() - start:.2f}s")
+
+        legacy, legacy_s = timed(legacy_ingest, paths)
+        serial, serial_s = timed(current_ingest, paths, 1)
+        parallel, parallel_s = timed(current_ingest, paths, args.workers)
+
+    print(f"{'流程':<24}{'秒數':>10}{'列數':>10}")
+    print(f"{'舊版 (read_excel x2)':<24}{legacy_s:>10.2f}{len(legacy):>10}")
+    print(f"{'ingest_files (1 程序)':<24}{serial_s:>10.2f}{len(serial):>10}")
+    print(f"{f'ingest_files ({args.workers} 程序)':<24}{parallel_s:>10.2f}{len(parallel):>10}")
+
+    same = legacy.astype(object).equals(serial.astype(object)) and serial.equals(parallel)
+    print("輸出一致" if same else "❌ 輸出不一致")
+    return 0 if same else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
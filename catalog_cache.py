@@ -0,0 +1,135 @@
+import threading
+import time
+from contextlib import nullcontext
+
+import pandas as pd
+
+
+class CatalogCache:
+    """
+    牌價表快取 (stale-while-revalidate)
+    - 第一次使用時同步下載；之後每 check_interval 秒在背景檢查版本
+      (Users!D1 的更新日期)，只有版本改變或超過 max_age 才重新下載整張表
+    - 背景更新期間使用者繼續拿到舊的 snapshot，不會被卡住
+    - 讀不到版本時沿用目前的版本，退回固定週期 (fallback_ttl) 重新下載
+    - 下載失敗時保留舊資料，retry_interval 秒後再試
+    - 有 store (CatalogSnapshot) 時，冷啟動先讀本機快照並立即在背景檢查版本，
+      每次下載成功後更新快照
+    - 多個 worker 共用同一個 store 時，版本改變只有持有 store.lock() 的 worker 下載，
+      其他 worker 看到快照已是新版本就直接讀快照，不再呼叫 Google API
+    snapshot 為 (df, index, key)，key 每次重新載入都會改變，可當快取鍵
+    """
+
+    def __init__(self, build, check_interval=60, max_age=3600, fallback_ttl=600,
+                 retry_interval=30, store=None):
+        self.build = build
+        self.store = store
+        self.check_interval = check_interval
+        self.max_age = max_age
+        self.fallback_ttl = fallback_ttl
+        self.retry_interval = retry_interval
+        self.snapshot = None
+        self.version = ""
+        self.loaded_at = 0
+        self.next_check = 0
+        self._lock = threading.Lock()
+
+    def get(self, fetch_version, fetch_data):
+        """
+        fetch_version(): 回傳目前資料版本字串 (讀不到回傳空字串)
+        fetch_data(): 下載整張牌價表，失敗回傳空的 DataFrame
+        """
+        if self.snapshot is None:
+            with self._lock:
+                if self.snapshot is None and not self._load_local():
+                    self._refresh(fetch_version, fetch_data)
+        if time.time() >= self.next_check and self._lock.acquire(blocking=False):
+            thread = threading.Thread(target=self._refresh_in_background,
+                                      args=(fetch_version, fetch_data),
+                                      name="catalog-refresh", daemon=True)
+            thread.start()
+        return self.snapshot
+
+    def _load_local(self):
+        """冷啟動時讀本機快照；next_check 維持 0，讓這次呼叫馬上在背景檢查版本"""
+        if self.store is None: return False
+        local = self.store.load()
+        if local is None: return False
+        df, version, loaded_at = local
+        if df.empty: return False
+        self.snapshot = self._build(df, version)
+        self.version = version
+        self.loaded_at = loaded_at
+        return True
+
+    def _refresh_in_background(self, fetch_version, fetch_data):
+        try:
+            self._refresh(fetch_version, fetch_data)
+        finally:
+            self._lock.release()
+
+    def _refresh(self, fetch_version, fetch_data):
+        """呼叫端須持有 self._lock"""
+        now = time.time()
+        try:
+            version = fetch_version()
+        except Exception:
+            version = ""
+        # 讀不到版本 (例如 D1 被限流) 時沿用目前的版本，只有超過 fallback_ttl 才重新下載；
+        # 版本恢復後與原本相同，也不會再多下載一次
+        max_age = self.max_age if version else self.fallback_ttl
+        version = version or self.version
+        fresh = now - self.loaded_at < max_age
+        if self.snapshot is not None and version == self.version and fresh:
+            self.next_check = now + self.check_interval
+            return
+        if self._adopt_shared(version, max_age):
+            return
+
+        with self.store.lock() if self.store is not None else nullcontext(False):
+            # 等鎖期間其他 worker 可能已經下載好同一個版本
+            if self._adopt_shared(version, max_age):
+                return
+            now = time.time()
+            try:
+                df = fetch_data()
+            except Exception:
+                df = None
+            if df is None or df.empty:
+                if self.snapshot is None:
+                    self.snapshot = self._build(df)
+                self.next_check = now + self.retry_interval
+                return
+
+            self.snapshot = self._build(df, version)
+            self.version = version
+            self.loaded_at = now
+            self.next_check = now + self.check_interval
+            if self.store is not None:
+                try:
+                    self.store.save(df, version, now)
+                except Exception:
+                    pass
+
+    def _adopt_shared(self, version, max_age):
+        """快照是其他 worker 剛下載的同一版本時直接採用，回傳是否採用"""
+        if self.store is None: return False
+        meta = self.store.peek()
+        if meta is None or meta[0] != version or time.time() - meta[1] >= max_age:
+            return False
+        if self.snapshot is not None and meta == (self.version, self.loaded_at):
+            return False
+        local = self.store.load()
+        if local is None or local[0].empty: return False
+        df, version, loaded_at = local
+        self.snapshot = self._build(df, version)
+        self.version = version
+        self.loaded_at = loaded_at
+        self.next_check = time.time() + self.check_interval
+        return True
+
+    def _build(self, df, version=""):
+        if df is None:
+            df = pd.DataFrame()
+        df, index = self.build(df)
+        return df, index, f"{version}@{time.time()}"
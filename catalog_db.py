@@ -0,0 +1,258 @@
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+
+from search_index import CODE_TOKEN_RE, normalize, normalize_cell
+
+# search_text 中欄位之間的分隔字元 (查詢字串不會含有它，避免跨欄位誤判)
+SEPARATOR = "\x1f"
+
+
+def _quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _meta_key(table, key):
+    """牌價表 (catalog) 沿用原本的 meta 名稱，其他資料表加上表名前綴"""
+    return key if table == 'catalog' else f"{table}.{key}"
+
+
+def _create_fts(db, table):
+    """建立 FTS5 trigram 索引；SQLite 太舊 (< 3.34) 或沒有 FTS5 時回傳 False，查詢改用 LIKE"""
+    try:
+        db.execute(f"CREATE VIRTUAL TABLE {table}_fts USING fts5("
+                   f"search_text, content='{table}', content_rowid='id', tokenize='trigram')")
+        db.execute(f"INSERT INTO {table}_fts({table}_fts) VALUES ('rebuild')")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def _create_search_table(db, table, df, search_cols, code_cols, price_cols):
+    """
+    建立可搜尋的資料表 (已存在則取代)，回傳要寫入 meta 的項目
+    - table: 原始欄位 + search_text (search_cols 正規化後合併) + codes (型號 token)
+    - table_fts: search_text 的 FTS5 trigram 索引 (子字串查詢)
+    - price_cols 轉成 REAL，查詢端不必再 clean_currency
+    """
+    cols = [str(c) for c in df.columns]
+    data = {c: df[c].tolist() for c in cols}
+    for c in price_cols:
+        if c in data:
+            clean = df[c].astype(str).str.replace(r'[^\d.]', '', regex=True)
+            data[c] = [None if pd.isna(v) else float(v) for v in pd.to_numeric(clean, errors='coerce')]
+
+    search = [data[c] for c in search_cols if c in data]
+    codes = [data[c] for c in code_cols if c in data]
+    search_text = [SEPARATOR.join(normalize_cell(v) for v in fields) for fields in zip(*search)] if search else [""] * len(df)
+    code_text = [" " + " ".join(sorted({t for v in fields for t in CODE_TOKEN_RE.findall(normalize_cell(v))}))
+                 for fields in zip(*codes)] if codes else [""] * len(df)
+
+    db.execute(f"DROP TABLE IF EXISTS {table}_fts")
+    db.execute(f"DROP TABLE IF EXISTS {table}")
+    col_defs = ", ".join(f"{_quote(c)} {'REAL' if c in price_cols else 'TEXT'}" for c in cols)
+    db.execute(f"CREATE TABLE {table} (id INTEGER PRIMARY KEY, {col_defs}, search_text TEXT, codes TEXT)")
+    placeholders = ", ".join("?" * (len(cols) + 3))
+    db.executemany(f"INSERT INTO {table} VALUES ({placeholders})",
+                   zip(range(1, len(df) + 1), *(data[c] for c in cols), search_text, code_text))
+    fts = _create_fts(db, table)
+    return [
+        (_meta_key(table, 'fts'), '1' if fts else '0'),
+        (_meta_key(table, 'columns'), json.dumps(cols, ensure_ascii=False)),
+    ]
+
+
+def _copy_other_tables(db, old_path):
+    """
+    把舊牌價檔中 catalog 以外的資料表 (例如 combinations、bundles) 與它們的 meta 複製到 db，
+    有 FTS 索引的表在 db 中重建索引；回傳要寫入 meta 的項目
+    """
+    if not os.path.exists(old_path): return []
+    db.commit()  # ATTACH 不能在交易中執行
+    db.execute("ATTACH DATABASE ? AS old", (old_path,))
+    try:
+        tables = db.execute("SELECT name, sql FROM old.sqlite_master WHERE type = 'table'").fetchall()
+        names = {name for name, _ in tables}
+        if 'meta' not in names: return []
+        old_meta = dict(db.execute("SELECT key, value FROM old.meta"))
+        meta = []
+        for name, sql in tables:
+            # FTS 虛擬表與其影子表 (…_fts_data 等) 不直接複製，之後依 meta 重建
+            if name in ('catalog', 'meta') or name.startswith('sqlite_') or '_fts' in name: continue
+            db.execute(sql)
+            db.execute(f"INSERT INTO main.{_quote(name)} SELECT * FROM old.{_quote(name)}")
+            items = {k: v for k, v in old_meta.items() if k.startswith(f"{name}.")}
+            if items.get(_meta_key(name, 'fts')) == '1':
+                items[_meta_key(name, 'fts')] = '1' if _create_fts(db, name) else '0'
+            meta.extend(items.items())
+        return meta
+    finally:
+        db.commit()
+        db.execute("DETACH DATABASE old")
+
+
+def write_catalog_db(path, df, search_cols, code_cols=(), price_cols=(), version=""):
+    """
+    把牌價表寫成 SQLite 檔 (data_merger --target sqlite)，資料表 catalog + catalog_fts
+    寫到暫存檔再 os.replace，線上查詢不會讀到寫一半的檔案；
+    舊檔中的其他資料表 (combinations、bundles) 一併搬到新檔，換檔後不會暫時消失
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp_path): os.remove(tmp_path)
+    db = sqlite3.connect(tmp_path)
+    try:
+        meta = _create_search_table(db, 'catalog', df, search_cols, code_cols, price_cols)
+        meta += _copy_other_tables(db, path)
+        db.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+        db.executemany("INSERT INTO meta VALUES (?, ?)", [('version', version or '')] + meta)
+        db.commit()
+    finally:
+        db.close()
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def _rewrite(path):
+    """
+    修改既有的牌價檔：先複製成暫存檔，在暫存檔上修改後再 os.replace。
+    直接在線上的檔案 DROP / 重建資料表時，查詢會在重新寫入前看到「沒有這張表」或空表
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp_path): os.remove(tmp_path)
+    db = sqlite3.connect(tmp_path)
+    try:
+        src = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            src.backup(db)
+        finally:
+            src.close()
+        yield db
+        db.commit()
+    except BaseException:
+        db.close()
+        os.remove(tmp_path)
+        raise
+    db.close()
+    os.replace(tmp_path, path)
+
+
+def write_search_table(path, table, df, search_cols, code_cols=(), price_cols=()):
+    """在既有的牌價檔中新增或取代一張可搜尋的資料表 (例如整套搭配 bundles)，查詢方式與 catalog 相同"""
+    with _rewrite(path) as db:
+        meta = _create_search_table(db, table, df, search_cols, code_cols, price_cols)
+        db.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)", meta)
+
+
+def write_table(path, name, df):
+    """在既有的牌價檔中新增或取代一張資料表 (例如組合搭配)"""
+    with _rewrite(path) as db:
+        df.to_sql(name, db, if_exists='replace', index=False)
+
+
+class CatalogDB:
+    """
+    唯讀查詢 write_catalog_db() 產生的牌價檔，worker 不必把整張表載入記憶體
+    - 連線放在共用的小型連線池 (Streamlit 每次重新執行都在新的執行緒)；
+      檔案被 os.replace 換掉時丟棄舊連線並重新讀取 meta
+    - search(): 3 個字以上走 FTS5 trigram 索引，較短的查詢以 LIKE 在 SQLite 內掃描
+    - 結果排序與 SearchIndex 相同：型號前綴命中的排前面，其餘依原始順序
+    - table: 要查詢的資料表 (write_search_table 寫入的其他表也可用)；檔案中沒有這張表時視為空表
+    """
+
+    def __init__(self, path, pool_size=8, table='catalog'):
+        self.path = path
+        self.pool_size = pool_size
+        self.table = table
+        self._lock = threading.Lock()
+        self._ident = None
+        self._meta = {}
+        self._count = 0
+        self._idle = []
+
+    def _open(self):
+        return sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+
+    def _refresh(self):
+        """回傳目前檔案的 (inode, mtime)；與上次不同時重新讀取 meta 與筆數"""
+        stat = os.stat(self.path)
+        ident = (stat.st_ino, stat.st_mtime_ns)
+        with self._lock:
+            if ident != self._ident:
+                conn = self._open()
+                self._meta = dict(conn.execute("SELECT key, value FROM meta"))
+                found = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                                     (self.table,)).fetchone()
+                self._count = conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0] if found else 0
+                for old in self._idle:
+                    old.close()
+                self._idle = [conn]
+                self._ident = ident
+        return ident
+
+    @contextmanager
+    def _connection(self):
+        ident = self._refresh()
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = self._open()
+        try:
+            yield conn
+        finally:
+            with self._lock:
+                if ident == self._ident and len(self._idle) < self.pool_size:
+                    self._idle.append(conn)
+                    conn = None
+            if conn is not None:
+                conn.close()
+
+    @property
+    def version(self):
+        """資料版本：merger 寫入的版本 + 檔案修改時間，檔案換掉就會改變"""
+        ident = self._refresh()
+        return f"{self._meta.get('version', '')}@{ident[1]}"
+
+    @property
+    def columns(self):
+        self._refresh()
+        return json.loads(self._meta.get(_meta_key(self.table, 'columns'), '[]'))
+
+    def __len__(self):
+        self._refresh()
+        return self._count
+
+    @property
+    def empty(self):
+        return len(self) == 0
+
+    def search(self, query, columns, limit):
+        """
+        回傳 (DataFrame, 符合的總筆數)；DataFrame 最多 limit 列、只含 columns 中存在的欄位。
+        空白查詢代表全部資料。
+        """
+        cols = [c for c in columns if c in self.columns]
+        select = ", ".join(_quote(c) for c in cols) or "id"
+        q = normalize(query).strip()
+        if not q:
+            where, args, order, order_args = "1", [], "id", []
+        else:
+            if self._meta.get(_meta_key(self.table, 'fts')) == '1' and len(q) >= 3:
+                where = f"id IN (SELECT rowid FROM {self.table}_fts WHERE {self.table}_fts MATCH ?)"
+                args = ['"' + q.replace('"', '""') + '"']
+            else:
+                escaped = q.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+                where, args = "search_text LIKE ? ESCAPE '\\'", [f"%{escaped}%"]
+            # codes 為 " token1 token2 ..."，" q" 出現代表有型號以 q 開頭
+            if " " in q:
+                order, order_args = "id", []
+            else:
+                order, order_args = "instr(codes, ?) = 0, id", [" " + q]
+        with self._connection() as conn:
+            total = conn.execute(f"SELECT COUNT(*) FROM {self.table} WHERE {where}", args).fetchone()[0]
+            rows = conn.execute(f"SELECT {select} FROM {self.table} WHERE {where} ORDER BY {order} LIMIT ?",
+                                args + order_args + [limit]).fetchall()
+        return pd.DataFrame(rows, columns=cols or ['id']), total
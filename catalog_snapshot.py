@@ -0,0 +1,86 @@
+import os
+import time
+from contextlib import nullcontext
+
+import pandas as pd
+
+from shared_cache import file_lock
+
+try:
+    import pyarrow as pa
+except ImportError:  # 沒有 pyarrow 時停用本機快照，其他功能照常
+    pa = None
+
+
+class CatalogSnapshot:
+    """
+    牌價表的本機 Arrow IPC 快照
+    - 啟動時以 memory map 讀取，不必等 Google Sheets 就能先顯示資料
+      (同一台主機的多個 worker 共用同一份 page cache)
+    - 每次成功下載後寫到暫存檔再 os.replace，讀取端不會看到寫一半的檔案
+    - peek() 只讀版本資訊、lock() 為跨程序的檔案鎖：同一台主機的 worker 以此協調，
+      同一個版本只由一個 worker 下載，其他 worker 直接讀快照 (見 CatalogCache)
+    """
+
+    def __init__(self, path, lock_timeout=120.0):
+        self.path = path
+        self.lock_timeout = lock_timeout
+
+    @property
+    def enabled(self):
+        return pa is not None and bool(self.path)
+
+    def load(self):
+        """回傳 (df, version, loaded_at)；沒有快照或讀取失敗回傳 None"""
+        if not self.enabled or not os.path.exists(self.path): return None
+        try:
+            # 關閉檔案後 table 的 buffer 仍然參照同一段 mmap
+            with pa.memory_map(self.path) as source:
+                table = pa.ipc.open_file(source).read_all()
+            meta = table.schema.metadata or {}
+            df = table.to_pandas(types_mapper=_string_types)
+            version = meta.get(b'version', b'').decode('utf-8')
+            loaded_at = float(meta.get(b'loaded_at', b'0'))
+            return df, version, loaded_at
+        except Exception:
+            return None
+
+    def peek(self):
+        """只讀 schema metadata，回傳 (version, loaded_at)；沒有快照或讀取失敗回傳 None"""
+        if not self.enabled or not os.path.exists(self.path): return None
+        try:
+            with pa.memory_map(self.path) as source:
+                meta = pa.ipc.open_file(source).schema.metadata or {}
+            return meta.get(b'version', b'').decode('utf-8'), float(meta.get(b'loaded_at', b'0'))
+        except Exception:
+            return None
+
+    def lock(self):
+        """下載與寫入快照期間持有；等超過 lock_timeout 秒就不再等"""
+        if not self.enabled: return nullcontext(False)
+        return file_lock(f"{self.path}.lock", self.lock_timeout)
+
+    def save(self, df, version, loaded_at=None):
+        if not self.enabled: return
+        loaded_at = time.time() if loaded_at is None else loaded_at
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.replace_schema_metadata({
+            'version': version or '',
+            'loaded_at': str(loaded_at),
+        })
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with pa.OSFile(tmp_path, 'wb') as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            os.replace(tmp_path, self.path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+def _string_types(arrow_type):
+    """字串欄位維持 Arrow 記憶體 (直接指向 mmap)，不轉成 Python str 物件"""
+    if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+        return pd.StringDtype("pyarrow")
+    return None
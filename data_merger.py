@@ -1,8 +1,22 @@
 import os
+import numpy as np
 import pandas as pd
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 import re
+import time
+import json
+import hashlib
+import inspect
+import argparse
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone, timedelta
+from openpyxl import load_workbook
+from openpyxl.cell.cell import ERROR_CODES
+from sheet_sync import sync_worksheet, upload_chunks
+from catalog_db import write_catalog_db, write_search_table, write_table
+from metrics import metrics
 
 # === 設定區 ===
 GOOGLE_SHEET_NAME = '經銷牌價表_資料庫'
@@ -12,6 +26,42 @@ COMBINATION_FILE = '整套搭配.xlsx' # 請確保這個檔案放在 excel_files
 
 # 一般查詢保留的欄位
 TARGET_COLUMNS = ['NO.', '規格', '牌價', '經銷價', '說明', '訂購品(V)']
+HEADER_SCAN_ROWS = 20  # 在前幾列之中尋找標題列
+# 差異更新時用來對應新舊資料的欄位
+SYNC_KEY_COLUMNS = ['規格', '來源檔案', '來源分頁']
+# 解析結果快取：檔案沒變就直接沿用上次的結果 (--force 可略過)
+MERGE_CACHE_DIR = './.merge_cache'
+MANIFEST_FILE = os.path.join(MERGE_CACHE_DIR, 'manifest.json')
+# --target sqlite 時輸出的牌價檔 (查詢系統的 secrets 以 catalog_db 指向它)
+CATALOG_DB_FILE = 'catalog.db'
+DB_SEARCH_COLUMNS = ['NO.', '規格', '說明']  # 與 app.py 的 SEARCH_COLS 相同
+DB_CODE_COLUMNS = ['NO.', '規格']
+DB_PRICE_COLUMNS = ['牌價', '經銷價']
+# 整套搭配：合併時把組合檔的組件型號對應到牌價表，先算好整套的牌價 / 經銷價合計
+BUNDLE_SHEET = 'Bundles'   # --target sheets 的分頁名稱
+BUNDLE_TABLE = 'bundles'   # --target sqlite 的資料表名稱
+BUNDLE_COLUMNS = ['系列', '組合', '組件', '牌價', '經銷價', '缺少型號']
+BUNDLE_KEY_COLUMNS = ['系列', '組合']
+BUNDLE_SEARCH_COLUMNS = ['系列', '組合', '組件']  # 與 app.py 的 BUNDLE_SEARCH_COLS 相同
+BUNDLE_CODE_COLUMNS = ['組合', '組件']
+COMPONENT_MATCH_RATIO = 0.5  # 一個欄位至少有這個比例的值對得到規格，才視為組件欄位
+BUNDLE_NAME_KEYWORDS = ['組合', '套', '名稱', '品名', '型號']  # 組合名稱欄位的標題關鍵字
+QUANTITY_KEYWORDS = ['數量', 'QTY', '台數', '個數']  # 組件數量欄位的標題關鍵字 (比對時不分大小寫)
+COMPONENT_SEPARATOR = ' + '
+
+# 標題別名：清理後 (去空白、全形括號轉半形) 的標題 -> TARGET_COLUMNS 中的名稱
+# 例如「經銷 價」清理後已是「經銷價」，這裡只需要列出用字不同的寫法
+HEADER_ALIASES = {
+    '經銷價格': '經銷價',
+    '經銷單價': '經銷價',
+    '牌價格': '牌價',
+    '定價': '牌價',
+    'NO': 'NO.',
+    'No.': 'NO.',
+    'No': 'NO.',
+    '訂購品': '訂購品(V)',
+    '訂購品V': '訂購品(V)',
+}
 
 def clean_header_name(header):
     if pd.isna(header): return ""
@@ -20,61 +70,453 @@ def clean_header_name(header):
     s = s.replace('（', '(').replace('）', ')')
     return s
 
-def find_header_row(file_path, sheet_name):
+def header_keywords(target):
+    """標題列判斷用的關鍵字：欄位本身 + 所有對應到它的別名"""
+    return [target] + [alias for alias, name in HEADER_ALIASES.items() if name == target]
+
+SPEC_KEYWORDS = header_keywords('規格')
+PRICE_KEYWORDS = header_keywords('經銷價') + header_keywords('牌價')
+
+def clean_header_array(block):
+    """整塊 (列 x 欄) 的儲存格一次做 clean_header_name，回傳 NumPy 字串陣列"""
+    arr = pd.DataFrame(block).to_numpy(dtype=object)
+    flat = pd.Series(arr.ravel(), dtype=object)
+    flat = flat.where(flat.notna(), "").astype(str)
+    flat = flat.str.replace(r'\s+', '', regex=True).str.replace('（', '(').str.replace('）', ')')
+    return flat.to_numpy(dtype=str).reshape(arr.shape)
+
+def find_header_index(block):
+    """在前幾列中找出同時含有規格與價格標題的第一列，找不到回傳 0"""
+    if not block: return 0
+    cleaned = clean_header_array(block)
+    has_spec = np.zeros(len(cleaned), dtype=bool)
+    has_price = np.zeros(len(cleaned), dtype=bool)
+    for kw in SPEC_KEYWORDS:
+        has_spec |= (np.char.find(cleaned, kw) >= 0).any(axis=1)
+    for kw in PRICE_KEYWORDS:
+        has_price |= (np.char.find(cleaned, kw) >= 0).any(axis=1)
+    hits = np.flatnonzero(has_spec & has_price)
+    return int(hits[0]) if len(hits) else 0
+
+def normalize_header(values):
+    names = [clean_header_name(v) for v in values]
+    return [HEADER_ALIASES.get(n, n) for n in names]
+
+def cell_to_str(val):
+    """
+    與 read_excel(dtype=str) 相同的轉換：整數值的 float 不帶 .0，空白維持 None，
+    錯誤儲存格 (#N/A、#REF! 等，values_only 讀到的是文字) 也視為空白
+    """
+    if val is None or (isinstance(val, float) and pd.isna(val)): return None
+    if isinstance(val, str) and val in ERROR_CODES: return None
+    if isinstance(val, float) and val.is_integer(): return str(int(val))
+    return str(val)
+
+def iter_workbook_sheets(file_path):
+    """活頁簿只開啟一次，逐一產生 (分頁名稱, 逐列資料)；xlsx 以唯讀串流讀取"""
+    if file_path.endswith('.xls'):
+        xls = pd.ExcelFile(file_path)
+        for sheet_name in xls.sheet_names:
+            raw = xls.parse(sheet_name, header=None, dtype=str)
+            yield sheet_name, raw.itertuples(index=False, name=None)
+        return
+    wb = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        for ws in wb.worksheets:
+            # 與 pandas 相同：不信任檔案中的 <dimension> (非 Excel 產生的檔案常常是錯的)
+            ws.reset_dimensions()
+            yield ws.title, ws.iter_rows(values_only=True)
+    finally:
+        wb.close()
+
+def rows_to_frame(rows):
+    """
+    先讀前 HEADER_SCAN_ROWS 列一次判斷標題列 (找不到就用第一列)，其餘列直接串流讀入，
+    回傳只含 TARGET_COLUMNS 的 DataFrame
+    """
+    rows = iter(rows)
+    block = [row for _, row in zip(range(HEADER_SCAN_ROWS), rows)]
+    if not block: return pd.DataFrame(columns=TARGET_COLUMNS, dtype=object)
+    header_idx = find_header_index(block)
+    header = normalize_header(block[header_idx])
+    data_rows = block[header_idx + 1:]
+    data_rows.extend(rows)
+
+    # 去掉尾端的全空白列 (read_only 模式會讀到格式化過的空列)
+    while data_rows and all(cell_to_str(v) is None for v in data_rows[-1]):
+        data_rows.pop()
+
+    # 同名欄位 (含別名) 只取第一個
+    positions = {}
+    for i, name in enumerate(header):
+        positions.setdefault(name, i)
+
+    # 逐欄轉字串：實測比整塊交給 pandas / NumPy 轉型還快
+    data = {}
+    for col in TARGET_COLUMNS:
+        i = positions.get(col)
+        if i is None:
+            data[col] = [""] * len(data_rows)
+        else:
+            data[col] = [cell_to_str(r[i]) if i < len(r) else None for r in data_rows]
+    # 沒有資料列時 (例如只有標題的封面分頁) 也維持 object 欄位，後續 .str 才不會出錯
+    return pd.DataFrame(data, columns=TARGET_COLUMNS, dtype=object)
+
+def ingest_workbook(file_path):
+    """
+    讀取單一活頁簿的所有分頁 (可在子程序中執行)
+    回傳 {'file', 'frames', 'sheets': [(分頁, 筆數, 秒數)], 'seconds', 'error', 'sheet_errors'}
+    - error: 活頁簿本身無法開啟 / 讀取
+    - sheet_errors: [(分頁, 錯誤)]；單一分頁失敗不影響其他分頁
+    """
+    file = os.path.basename(file_path)
+    result = {'file': file, 'frames': [], 'sheets': [], 'seconds': 0.0, 'error': None, 'sheet_errors': []}
+    start = time.perf_counter()
+    try:
+        for sheet_name, rows in iter_workbook_sheets(file_path):
+            sheet_start = time.perf_counter()
+            try:
+                clean_df = rows_to_frame(rows)
+                if '規格' in clean_df.columns:
+                    clean_df = clean_df[clean_df['規格'].str.strip() != '']
+            except Exception as e:
+                result['sheet_errors'].append((sheet_name, str(e)))
+                continue
+
+            if not clean_df.empty:
+                clean_df['來源檔案'] = file
+                clean_df['來源分頁'] = sheet_name
+                result['frames'].append(clean_df)
+                result['sheets'].append((sheet_name, len(clean_df), time.perf_counter() - sheet_start))
+    except Exception as e:
+        result['error'] = str(e)
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+def ingest_files(file_paths, workers=1):
+    """workers > 1 時以多個程序平行讀取各活頁簿；結果維持 file_paths 的順序"""
+    if workers <= 1 or len(file_paths) <= 1:
+        return [ingest_workbook(p) for p in file_paths]
+    with ProcessPoolExecutor(max_workers=min(workers, len(file_paths))) as pool:
+        return list(pool.map(ingest_workbook, file_paths))
+
+def tw_now():
+    return datetime.now(timezone(timedelta(hours=8))).strftime("%Y-%m-%d %H:%M:%S")
+
+def mark_update_date(sh):
+    """
+    更新 Users!D1 的時間；查詢系統以這個值當作資料版本判斷是否需要重新下載牌價表，
+    所以要精確到秒 (同一天合併兩次也必須改變)
+    """
+    try:
+        sh.worksheet("Users").update_cell(1, 4, tw_now())
+    except Exception as e: print(f"⚠️ 更新日期寫入失敗: {e}")
+
+# === 解析結果快取 ===
+def file_sha256(file_path):
+    h = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def load_manifest():
+    """manifest: 檔名 -> {size, mtime, sha256, frame}"""
+    try:
+        with open(MANIFEST_FILE, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(manifest):
+    os.makedirs(MERGE_CACHE_DIR, exist_ok=True)
+    tmp_path = MANIFEST_FILE + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, MANIFEST_FILE)
+
+@lru_cache(maxsize=None)
+def parser_version():
+    """
+    解析邏輯與設定的雜湊：標題別名、保留欄位或解析函式改變時，舊的快取結果一律失效
+    (不必記得加 --force)
+    """
+    h = hashlib.sha256(json.dumps([TARGET_COLUMNS, HEADER_ALIASES, HEADER_SCAN_ROWS],
+                                  ensure_ascii=False).encode('utf-8'))
+    for fn in (clean_header_name, header_keywords, clean_header_array, find_header_index,
+               normalize_header, cell_to_str, iter_workbook_sheets, rows_to_frame,
+               ingest_workbook, read_combination_file):
+        h.update(inspect.getsource(fn).encode('utf-8'))
+    return h.hexdigest()[:16]
+
+def cache_lookup(manifest, file_path, force=False):
+    """
+    回傳 (快取的 DataFrame 或 None, 檔案指紋)
+    size + mtime 相同就直接採用；不同時再比對 sha256 (例如只是被重新複製過)，
+    內容相同就把新的 size / mtime 寫回 manifest，下次不必再算 sha256。
+    快取是舊版解析邏輯產生的 (parser_version 不同) 時視為未命中
+    """
+    st = os.stat(file_path)
+    fingerprint = {'size': st.st_size, 'mtime': st.st_mtime, 'parser': parser_version()}
+    entry = None if force else manifest.get(os.path.basename(file_path))
+    if entry and entry.get('parser') != fingerprint['parser']:
+        entry = None
+    if entry and (entry['size'], entry['mtime']) == (st.st_size, st.st_mtime):
+        fingerprint['sha256'] = entry['sha256']
+    else:
+        fingerprint['sha256'] = file_sha256(file_path)
+        if not entry or entry['sha256'] != fingerprint['sha256']:
+            return None, fingerprint
+        entry.update(size=st.st_size, mtime=st.st_mtime)
+    frame_path = os.path.join(MERGE_CACHE_DIR, entry['frame'])
+    try:
+        return pd.read_parquet(frame_path), fingerprint
+    except Exception:
+        return None, fingerprint
+
+def cache_store(manifest, file_path, fingerprint, df):
+    os.makedirs(MERGE_CACHE_DIR, exist_ok=True)
+    file = os.path.basename(file_path)
+    frame = fingerprint['sha256'][:16] + '.parquet'
+    df.to_parquet(os.path.join(MERGE_CACHE_DIR, frame), index=False)
+    old = manifest.get(file)
+    if old and old['frame'] != frame:
+        try: os.remove(os.path.join(MERGE_CACHE_DIR, old['frame']))
+        except OSError: pass
+    manifest[file] = dict(fingerprint, frame=frame)
+
+def prune_manifest(manifest):
+    """移除 excel_files 中已不存在的檔案與其快取"""
+    for file in list(manifest):
+        if not os.path.exists(os.path.join(EXCEL_FOLDER, file)):
+            try: os.remove(os.path.join(MERGE_CACHE_DIR, manifest[file]['frame']))
+            except OSError: pass
+            del manifest[file]
+
+def upload_checkpoint(ws):
+    """整張上傳的進度檔 (每個分頁一個)，中斷後重新執行會從這裡繼續"""
+    os.makedirs(MERGE_CACHE_DIR, exist_ok=True)
+    return os.path.join(MERGE_CACHE_DIR, f"upload_{ws.title}.json")
+
+def upload_frame(ws, df, key_cols=None, full_upload=False):
+    """預設只送出有變動的列；full_upload 則分塊整張重寫 (可從中斷處繼續)。回傳是否有寫入"""
+    if full_upload:
+        with metrics.span('merger.upload'):
+            stats = upload_chunks(ws, df, upload_checkpoint(ws))
+        resumed = f", 沿用上次 {stats['resumed']} 塊" if stats['resumed'] else ""
+        print(f"   整張上傳: {stats['rows']} 列分成 {stats['chunks']} 塊{resumed}, "
+              f"共 {stats['requests']} 個請求, 重試 {stats['retries']} 次")
+        return True
+    with metrics.span('merger.upload'):
+        stats = sync_worksheet(ws, df, key_cols)
+    print(f"   差異更新: {stats['changed']} 列變動, 清除 {stats['cleared']} 列, "
+          f"共 {stats['requests']} 個請求, 重試 {stats['retries']} 次")
+    return stats['requests'] > 0
+
+# === 整套搭配 ===
+def spec_key(value):
+    """規格比對用的鍵：去空白、全形括號轉半形、不分大小寫"""
+    return clean_header_name(value).upper()
+
+def price_to_float(value):
+    """$12,000 之類的文字價格轉成 float，無法轉換回傳 None"""
+    try: return float(re.sub(r'[^\d.]', '', str(value)))
+    except ValueError: return None
+
+def format_price(value):
+    if value is None: return ""
+    return str(int(value)) if float(value).is_integer() else f"{value:.2f}"
+
+def build_price_lookup(catalog_df):
+    """規格 -> (牌價, 經銷價)；同一規格出現在多個檔案時取第一筆"""
+    lookup = {}
+    n = len(catalog_df)
+    list_prices = catalog_df['牌價'].tolist() if '牌價' in catalog_df.columns else [""] * n
+    dealer_prices = catalog_df['經銷價'].tolist() if '經銷價' in catalog_df.columns else [""] * n
+    for spec, list_price, dealer_price in zip(catalog_df['規格'].tolist(), list_prices, dealer_prices):
+        key = spec_key(spec)
+        if key and key not in lookup:
+            lookup[key] = (price_to_float(list_price), price_to_float(dealer_price))
+    return lookup
+
+def find_component_columns(df, lookup):
+    """回傳大多數值都是牌價表規格的欄位 (組件欄位)"""
+    cols = []
+    for col in df.columns:
+        if col == '系列': continue
+        keys = [k for k in (spec_key(v) for v in df[col].tolist()) if k]
+        if keys and sum(k in lookup for k in keys) >= len(keys) * COMPONENT_MATCH_RATIO:
+            cols.append(col)
+    return cols
+
+def find_quantity_columns(df, comp_cols):
+    """
+    組件欄位 -> 數量欄位：組件欄位右邊、下一個組件欄位之前第一個標題含 QUANTITY_KEYWORDS 的欄位
+    (例如 伺服馬達 | 數量 | 驅動器 | 數量)；沒有數量欄位的組件視為 1 個
+    """
+    columns = list(df.columns)
+    comp_pos = [columns.index(c) for c in comp_cols]
+    quantities = {}
+    for i, start in enumerate(comp_pos):
+        end = comp_pos[i + 1] if i + 1 < len(comp_pos) else len(columns)
+        for col in columns[start + 1:end]:
+            if any(kw in clean_header_name(col).upper() for kw in QUANTITY_KEYWORDS):
+                quantities[columns[start]] = col
+                break
+    return quantities
+
+def parse_quantity(value):
+    """數量欄位的值：空白為 1，無法轉換或不是正數回傳 None"""
+    if not str(value).strip(): return 1.0
+    qty = price_to_float(value)
+    return qty if qty else None
+
+def build_bundles(comb_df, catalog_df):
+    """
+    把組合檔每一列 (一組整套搭配) 的組件對應到牌價表，回傳 BUNDLE_COLUMNS 的 DataFrame
+    - 各系列 (分頁) 的欄位不同，組件欄位逐系列判斷
+    - 組合名稱取標題含 BUNDLE_NAME_KEYWORDS 的非組件欄位，沒有就以組件型號串起來
+    - 組件後面有數量欄位 (見 find_quantity_columns) 時價格乘上數量，組件欄位顯示為「型號 ×數量」
+    - 牌價 / 經銷價為組件價格合計；牌價表查無、沒有價格或數量無法辨識的組件列在「缺少型號」，
+      這時合計留白 (不顯示只加總部分組件的金額)
+    """
+    if comb_df is None or catalog_df is None or '規格' not in catalog_df.columns:
+        return pd.DataFrame(columns=BUNDLE_COLUMNS)
+    lookup = build_price_lookup(catalog_df)
+    series_col = comb_df['系列'] if '系列' in comb_df.columns else pd.Series("", index=comb_df.index)
+    bundles = []
+    for series, group in comb_df.groupby(series_col, sort=False):
+        group = group.loc[:, (group != "").any()]
+        comp_cols = find_component_columns(group, lookup)
+        qty_cols = find_quantity_columns(group, comp_cols)
+        name_cols = [c for c in group.columns if c not in comp_cols and c != '系列'
+                     and c not in qty_cols.values()
+                     and any(kw in clean_header_name(c) for kw in BUNDLE_NAME_KEYWORDS)]
+        for row in group.to_dict('records'):
+            models, parts, missing = [], [], []
+            list_total = dealer_total = 0.0
+            for col in comp_cols:
+                part = str(row[col]).strip()
+                if not spec_key(part): continue
+                models.append(part)
+                qty_text = str(row[qty_cols[col]]).strip() if col in qty_cols else ""
+                qty = parse_quantity(qty_text)
+                parts.append(part if qty == 1 else f"{part} ×{qty_text}")
+                list_price, dealer_price = lookup.get(spec_key(part), (None, None))
+                if qty is None or list_price is None or dealer_price is None:
+                    missing.append(part)
+                    continue
+                list_total += list_price * qty
+                dealer_total += dealer_price * qty
+            if not parts: continue
+            names = [str(row[c]).strip() for c in name_cols if str(row[c]).strip()]
+            bundles.append([
+                series,
+                names[0] if names else COMPONENT_SEPARATOR.join(models),
+                COMPONENT_SEPARATOR.join(parts),
+                format_price(None if missing else list_total),
+                format_price(None if missing else dealer_total),
+                COMPONENT_SEPARATOR.join(missing),
+            ])
+    return pd.DataFrame(bundles, columns=BUNDLE_COLUMNS)
+
+def open_or_add_worksheet(sh, title):
     try:
-        df_temp = pd.read_excel(file_path, sheet_name=sheet_name, header=None, nrows=20)
-        for idx, row in df_temp.iterrows():
-            row_str = "".join([clean_header_name(x) for x in row.values])
-            if '規格' in row_str and ('經銷價' in row_str or '牌價' in row_str):
-                return idx
-    except: pass
-    return 0
-
-def process_general_files(client):
-    """處理一般經銷牌價 Excel"""
+        return sh.worksheet(title)
+    except gspread.exceptions.WorksheetNotFound:
+        return sh.add_worksheet(title=title, rows="1000", cols="20")
+
+def process_general_files(client, workers=1, full_upload=False, force=False,
+                          target='sheets', db_path=CATALOG_DB_FILE):
+    """處理一般經銷牌價 Excel，回傳合併後的牌價表 (沒有資料回傳 None)"""
     if not os.path.exists(EXCEL_FOLDER): return None
     files = [f for f in os.listdir(EXCEL_FOLDER) if f.endswith(('.xlsx', '.xls')) and f != COMBINATION_FILE]
     all_data = []
     
-    print(f"--- 正在處理一般牌價表 ({len(files)} 個檔案) ---")
+    print(f"--- 正在處理一般牌價表 ({len(files)} 個檔案, {workers} 個程序) ---")
+    start = time.perf_counter()
+    manifest = load_manifest()
+    frames, fingerprints, changed = {}, {}, []
     for file in files:
         file_path = os.path.join(EXCEL_FOLDER, file)
-        try:
-            xls = pd.ExcelFile(file_path)
-            for sheet_name in xls.sheet_names:
-                header_idx = find_header_row(file_path, sheet_name)
-                df = pd.read_excel(file_path, sheet_name=sheet_name, header=header_idx, dtype=str)
-                df.columns = [clean_header_name(c) for c in df.columns]
-                
-                clean_df = pd.DataFrame(columns=TARGET_COLUMNS)
-                for col in TARGET_COLUMNS:
-                    if col in df.columns: clean_df[col] = df[col]
-                    else: clean_df[col] = ""
-                
-                if '規格' in clean_df.columns:
-                    clean_df = clean_df[clean_df['規格'].str.strip() != '']
-                    
-                if not clean_df.empty:
-                    clean_df['來源檔案'] = file
-                    clean_df['來源分頁'] = sheet_name
-                    all_data.append(clean_df)
-                    print(f" - 讀取: {file} / {sheet_name}")
-        except Exception as e:
-            print(f" X 失敗: {file} - {e}")
+        cached, fingerprints[file] = cache_lookup(manifest, file_path, force)
+        if cached is None:
+            changed.append(file_path)
+        else:
+            frames[file] = [cached] if not cached.empty else []
+            print(f" - 快取: {file} (未變更, {len(cached)} 筆)")
+
+    for result in ingest_files(changed, workers):
+        file = result['file']
+        for sheet_name, rows, seconds in result['sheets']:
+            metrics.observe('merger.sheet', seconds, file=file, sheet=sheet_name, rows=rows)
+            print(f" - 讀取: {file} / {sheet_name} ({rows} 筆, {seconds:.2f}s)")
+        metrics.observe('merger.file', result['seconds'], file=file)
+        for sheet_name, error in result['sheet_errors']:
+            print(f" X 分頁失敗: {file} / {sheet_name} - {error}")
+        if result['error']:
+            print(f" X 失敗: {file} - {result['error']}")
+        elif result['sheet_errors']:
+            # 有分頁失敗時不寫入快取，下次執行重新解析
+            print(f"   {file} 部分完成 ({result['seconds']:.2f}s)")
+        else:
+            print(f"   {file} 完成 ({result['seconds']:.2f}s)")
+            parsed = pd.concat(result['frames'], ignore_index=True) if result['frames'] else pd.DataFrame(columns=TARGET_COLUMNS + ['來源檔案', '來源分頁'])
+            cache_store(manifest, os.path.join(EXCEL_FOLDER, file), fingerprints[file], parsed)
+        frames[file] = result['frames']
+    prune_manifest(manifest)
+    save_manifest(manifest)
+    for file in files:
+        all_data.extend(frames.get(file, []))
+    print(f"--- 讀取完成 ({len(changed)} 個檔案重新解析)，共 {time.perf_counter() - start:.2f}s ---")
             
     if all_data:
         final_df = pd.concat(all_data, ignore_index=True).fillna("")
+        if target == 'sqlite':
+            with metrics.span('merger.write_db'):
+                write_catalog_db(db_path, final_df, DB_SEARCH_COLUMNS, DB_CODE_COLUMNS,
+                                 DB_PRICE_COLUMNS, version=tw_now())
+            print(f"✅ 一般牌價資料已寫入 {db_path} ({len(final_df)} 筆)")
+            if client:
+                try: mark_update_date(client.open(GOOGLE_SHEET_NAME))
+                except Exception as e: print(f"⚠️ 更新日期寫入失敗: {e}")
+            return final_df
         try:
             sh = client.open(GOOGLE_SHEET_NAME)
             # 上傳到第一頁 (一般資料庫)
             ws = sh.sheet1 
-            ws.clear()
-            ws.update([final_df.columns.values.tolist()] + final_df.values.tolist())
+            if upload_frame(ws, final_df, SYNC_KEY_COLUMNS, full_upload):
+                mark_update_date(sh)
             print("✅ 一般牌價資料更新完成！")
         except Exception as e: print(f"❌ 上傳失敗: {e}")
+        return final_df
 
-def process_combination_file(client):
-    """處理組合搭配 Excel"""
+def read_combination_file(comb_path):
+    """讀取組合檔所有分頁並合併；沒有資料回傳 None"""
+    xls = pd.ExcelFile(comb_path)
+    all_comb_data = []
+    
+    # 假設組合檔的標題都在第 0 列 (通常是第一列)
+    # 我們把所有 Sheet 合併，但多加一個「系列」欄位
+    for sheet_name in xls.sheet_names:
+        # 跳過非數據頁
+        if sheet_name in ['DATA', '經銷價(總)']: continue
+        
+        # 讀取資料 (假設第一列是標題)
+        df = xls.parse(sheet_name, dtype=str)
+        df['系列'] = sheet_name # 把 Sheet 名稱變成系列名稱 (例如: 整套_SDC)
+        
+        # 簡單清洗：移除全空行
+        df.dropna(how='all', inplace=True)
+        all_comb_data.append(df)
+        print(f" - 讀取組合: {sheet_name}")
+        
+    if not all_comb_data: return None
+    return pd.concat(all_comb_data, ignore_index=True).fillna("")
+
+def process_combination_file(client, catalog_df=None, full_upload=False, force=False,
+                             target='sheets', db_path=CATALOG_DB_FILE):
+    """處理組合搭配 Excel；有 catalog_df (本次合併的牌價表) 時一併算出整套合計"""
     comb_path = os.path.join(EXCEL_FOLDER, COMBINATION_FILE)
     if not os.path.exists(comb_path):
         print(f"⚠️ 找不到 {COMBINATION_FILE}，跳過組合更新。")
@@ -82,51 +524,84 @@ def process_combination_file(client):
 
     print(f"--- 正在處理組合搭配檔案 ({COMBINATION_FILE}) ---")
     try:
-        xls = pd.ExcelFile(comb_path)
-        all_comb_data = []
-        
-        # 假設組合檔的標題都在第 0 列 (通常是第一列)
-        # 我們把所有 Sheet 合併，但多加一個「系列」欄位
-        for sheet_name in xls.sheet_names:
-            # 跳過非數據頁
-            if sheet_name in ['DATA', '經銷價(總)']: continue
-            
-            # 讀取資料 (假設第一列是標題)
-            df = pd.read_excel(comb_path, sheet_name=sheet_name, dtype=str)
-            df['系列'] = sheet_name # 把 Sheet 名稱變成系列名稱 (例如: 整套_SDC)
-            
-            # 簡單清洗：移除全空行
-            df.dropna(how='all', inplace=True)
-            all_comb_data.append(df)
-            print(f" - 讀取組合: {sheet_name}")
-            
-        if all_comb_data:
-            final_comb = pd.concat(all_comb_data, ignore_index=True).fillna("")
+        manifest = load_manifest()
+        final_comb, fingerprint = cache_lookup(manifest, comb_path, force)
+        if final_comb is not None:
+            print(f" - 快取: {COMBINATION_FILE} (未變更, {len(final_comb)} 筆)")
+            final_comb = final_comb.fillna("") if not final_comb.empty else None
+        else:
+            final_comb = read_combination_file(comb_path)
+            cache_store(manifest, comb_path, fingerprint, final_comb if final_comb is not None else pd.DataFrame())
+        save_manifest(manifest)
+
+        bundles = None
+        if final_comb is not None and catalog_df is not None:
+            with metrics.span('merger.bundles'):
+                bundles = build_bundles(final_comb, catalog_df)
+            incomplete = (bundles['缺少型號'] != "").sum()
+            print(f" - 整套合計: {len(bundles)} 組 ({incomplete} 組有查無價格的組件)")
             
+        if final_comb is not None and target == 'sqlite':
+            if not os.path.exists(db_path):
+                print(f"⚠️ 找不到 {db_path}，組合資料未寫入。")
+                return
+            write_table(db_path, 'combinations', final_comb)
+            if bundles is not None:
+                write_search_table(db_path, BUNDLE_TABLE, bundles, BUNDLE_SEARCH_COLUMNS,
+                                   BUNDLE_CODE_COLUMNS, DB_PRICE_COLUMNS)
+            print(f"✅ 組合搭配資料已寫入 {db_path}")
+        elif final_comb is not None:
             sh = client.open(GOOGLE_SHEET_NAME)
-            # 嘗試開啟或建立 'Combinations' 分頁
-            try:
-                ws = sh.worksheet('Combinations')
-            except:
-                ws = sh.add_worksheet(title='Combinations', rows="1000", cols="20")
-            
-            ws.clear()
-            ws.update([final_comb.columns.values.tolist()] + final_comb.values.tolist())
+            # 組合檔沒有固定的鍵欄位，以整列內容比對
+            upload_frame(open_or_add_worksheet(sh, 'Combinations'), final_comb, None, full_upload)
+            # 整套合計改變時也更新日期，查詢系統才會重新載入
+            if bundles is not None and upload_frame(open_or_add_worksheet(sh, BUNDLE_SHEET), bundles,
+                                                    BUNDLE_KEY_COLUMNS, full_upload):
+                mark_update_date(sh)
             print("✅ 組合搭配資料更新完成！")
             
     except Exception as e:
         print(f"❌ 組合檔處理失敗: {e}")
 
 def main():
+    parser = argparse.ArgumentParser(description="合併 Excel 牌價表並上傳到 Google Sheets")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="平行讀取活頁簿的程序數 (1 = 不開子程序)")
+    parser.add_argument('--full-upload', action='store_true',
+                        help="分塊整張重寫，中斷後重新執行會從中斷處繼續 (預設只更新有變動的列)")
+    parser.add_argument('--force', action='store_true',
+                        help="忽略解析快取，所有 Excel 重新解析")
+    parser.add_argument('--target', choices=['sheets', 'sqlite'], default='sheets',
+                        help="上傳到 Google Sheets，或寫成本機 SQLite 牌價檔 (含全文索引)")
+    parser.add_argument('--db-path', default=CATALOG_DB_FILE, help="--target sqlite 的輸出檔案")
+    parser.add_argument('--metrics-file',
+                        help="把各檔案 / 分頁 / 上傳的耗時以 Prometheus 文字格式寫到這個檔案")
+    args = parser.parse_args()
+
     scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
-    if not os.path.exists(JSON_KEY_FILE): return
-    creds = ServiceAccountCredentials.from_json_keyfile_name(JSON_KEY_FILE, scope)
-    client = gspread.authorize(creds)
+    client = None
+    if os.path.exists(JSON_KEY_FILE):
+        creds = ServiceAccountCredentials.from_json_keyfile_name(JSON_KEY_FILE, scope)
+        client = gspread.authorize(creds)
+    elif args.target == 'sheets':
+        return
     
     # 1. 處理一般檔案
-    process_general_files(client)
-    # 2. 處理組合檔案
-    process_combination_file(client)
+    catalog_df = process_general_files(client, args.workers, args.full_upload, args.force,
+                                       args.target, args.db_path)
+    # 2. 處理組合檔案 (整套合計用上一步的牌價表)
+    process_combination_file(client, catalog_df, args.full_upload, args.force, args.target, args.db_path)
+
+    print_timings()
+    if args.metrics_file:
+        metrics.write_textfile(args.metrics_file)
+
+def print_timings():
+    spans, _ = metrics.summary()
+    if not spans: return
+    print("--- 耗時統計 ---")
+    for name, s in spans.items():
+        print(f" {name:<14} {s['count']:>5} 次  合計 {s['total']:.2f}s  p50 {s['p50']:.2f}s  p95 {s['p95']:.2f}s")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,11 +1,45 @@
-import bcrypt
+import argparse
+import csv
+import sys
+from passwords import hash_password, hash_many, DEFAULT_ROUNDS
 
 # 在這裡輸入您想設定的初始管理員密碼
 my_password = "admin"  # <--- 您可以改成您要的密碼
 
-# 產生加密字串
-hashed = bcrypt.hashpw(my_password.encode('utf-8'), bcrypt.gensalt())
-print("請將下方這串亂碼，複製貼上到 Google Sheet 的 password 欄位：")
-print("-" * 30)
-print(hashed.decode('utf-8'))
-print("-" * 30)
\ No newline at end of file
+def main():
+    parser = argparse.ArgumentParser(description="產生 bcrypt 密碼雜湊 (可批次處理整份帳號清單)")
+    parser.add_argument('--rounds', type=int, default=DEFAULT_ROUNDS, help="bcrypt 成本參數")
+    parser.add_argument('--input', help="帳號 CSV (需有 email,password 欄位)；不指定則只雜湊 my_password")
+    parser.add_argument('--output', help="輸出 CSV，預設印到螢幕")
+    parser.add_argument('--workers', type=int, default=None, help="平行處理的程序數 (預設為 CPU 核心數)")
+    args = parser.parse_args()
+
+    if not args.input:
+        # 產生加密字串
+        hashed = hash_password(my_password, args.rounds)
+        print("請將下方這串亂碼，複製貼上到 Google Sheet 的 password 欄位：")
+        print("-" * 30)
+        print(hashed)
+        print("-" * 30)
+        return
+
+    # 批次模式：password 欄位換成雜湊後輸出，其餘欄位照原樣保留
+    with open(args.input, newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        fields = reader.fieldnames
+        users = list(reader)
+
+    hashes = hash_many([u['password'] for u in users], args.rounds, args.workers)
+    for user, hashed in zip(users, hashes):
+        user['password'] = hashed
+
+    out = open(args.output, 'w', newline='', encoding='utf-8-sig') if args.output else sys.stdout
+    writer = csv.DictWriter(out, fieldnames=fields)
+    writer.writeheader()
+    writer.writerows(users)
+    if args.output:
+        out.close()
+        print(f"完成：{len(users)} 筆帳號已寫入 {args.output}")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,298 @@
+import itertools
+import json
+import sqlite3
+import threading
+import time
+import uuid
+
+from gspread.cell import Cell
+from gspread.exceptions import SpreadsheetNotFound, WorksheetNotFound
+from gspread.utils import a1_range_to_grid_range, numericise_all
+
+
+class LocalClient:
+    """
+    以 SQLite 模擬 Google Sheets，介面與本專案用到的 gspread 方法相同
+    (open / open_by_key / create、worksheet / add_worksheet、get_all_records / get_all_values /
+    cell / find / update_cell / append_row(s) / update / batch_update / batch_clear / clear)
+    - path=":memory:" 為純記憶體；給檔案路徑時多個程序 (例如壓力測試) 可共用同一份資料
+    - latency: 每次 API 呼叫額外等待的秒數，用來模擬網路延遲
+    - calls: 各方法的呼叫次數，方便比較不同版本送出的請求數
+    """
+
+    def __init__(self, path=":memory:", latency=0.0):
+        self.latency = latency
+        self.calls = {}
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS spreadsheets (id TEXT PRIMARY KEY, title TEXT);
+            CREATE TABLE IF NOT EXISTS worksheets (
+                spreadsheet TEXT, title TEXT, position INTEGER, row_count INTEGER, col_count INTEGER,
+                PRIMARY KEY (spreadsheet, title));
+            CREATE TABLE IF NOT EXISTS rows (
+                spreadsheet TEXT, sheet TEXT, idx INTEGER, data TEXT,
+                PRIMARY KEY (spreadsheet, sheet, idx)) WITHOUT ROWID;
+        """)
+
+    def _call(self, name):
+        """記錄呼叫次數並模擬延遲；回傳 DB 鎖"""
+        self.calls[name] = self.calls.get(name, 0) + 1
+        if self.latency: time.sleep(self.latency)
+        return self._lock
+
+    def _query(self, sql, args=()):
+        with self._lock:
+            return self._db.execute(sql, args).fetchall()
+
+    def open(self, title):
+        with self._call('open'):
+            found = self._query("SELECT id FROM spreadsheets WHERE title = ?", (title,))
+        if not found: raise SpreadsheetNotFound(title)
+        return LocalSpreadsheet(self, found[0][0], title)
+
+    def open_by_key(self, key):
+        with self._call('open_by_key'):
+            found = self._query("SELECT title FROM spreadsheets WHERE id = ?", (key,))
+        if not found: raise SpreadsheetNotFound(key)
+        return LocalSpreadsheet(self, key, found[0][0])
+
+    def create(self, title):
+        """建立空白試算表 (含一個 Sheet1 分頁)"""
+        key = uuid.uuid4().hex
+        with self._call('create'):
+            self._query("INSERT INTO spreadsheets VALUES (?, ?)", (key, title))
+        sh = LocalSpreadsheet(self, key, title)
+        sh.add_worksheet("Sheet1", 1000, 26)
+        return sh
+
+
+class LocalSpreadsheet:
+
+    def __init__(self, client, key, title):
+        self.client = client
+        self.id = key
+        self.title = title
+
+    def worksheets(self):
+        with self.client._call('fetch_sheet_metadata'):
+            titles = self.client._query(
+                "SELECT title FROM worksheets WHERE spreadsheet = ? ORDER BY position", (self.id,))
+        return [LocalWorksheet(self, t) for (t,) in titles]
+
+    @property
+    def sheet1(self):
+        sheets = self.worksheets()
+        if not sheets: raise WorksheetNotFound("sheet1")
+        return sheets[0]
+
+    def worksheet(self, title):
+        with self.client._call('fetch_sheet_metadata'):
+            found = self.client._query(
+                "SELECT 1 FROM worksheets WHERE spreadsheet = ? AND title = ?", (self.id, title))
+        if not found: raise WorksheetNotFound(title)
+        return LocalWorksheet(self, title)
+
+    def add_worksheet(self, title, rows, cols, index=None):
+        with self.client._call('add_worksheet'):
+            position = self.client._query(
+                "SELECT COALESCE(MAX(position) + 1, 0) FROM worksheets WHERE spreadsheet = ?",
+                (self.id,))[0][0]
+            self.client._query("INSERT INTO worksheets VALUES (?, ?, ?, ?, ?)",
+                               (self.id, title, position, int(rows), int(cols)))
+        return LocalWorksheet(self, title)
+
+
+class LocalWorksheet:
+
+    def __init__(self, spreadsheet, title):
+        self.spreadsheet = spreadsheet
+        self.client = spreadsheet.client
+        self.title = title
+        self._key = (spreadsheet.id, title)
+
+    # --- 內部存取 ---
+    def _size(self):
+        return self.client._query(
+            "SELECT row_count, col_count FROM worksheets WHERE spreadsheet = ? AND title = ?", self._key)[0]
+
+    @property
+    def row_count(self):
+        return self._size()[0]
+
+    @property
+    def col_count(self):
+        return self._size()[1]
+
+    def _grow(self, rows, cols):
+        row_count, col_count = self._size()
+        self.client._query(
+            "UPDATE worksheets SET row_count = ?, col_count = ? WHERE spreadsheet = ? AND title = ?",
+            (max(row_count, rows), max(col_count, cols)) + self._key)
+
+    def _rows(self, first=1, last=None):
+        """回傳 {列號 (從 1 開始): [值, ...]}，可只讀 first 到 last 列"""
+        last = 2 ** 62 if last is None else last
+        found = self.client._query(
+            "SELECT idx, data FROM rows WHERE spreadsheet = ? AND sheet = ? AND idx BETWEEN ? AND ?"
+            " ORDER BY idx", self._key + (first, last))
+        return {idx: json.loads(data) for idx, data in found}
+
+    def _put(self, updates):
+        """updates: {列號: 整列的值}，整列都是空字串時刪除"""
+        drop = [(i,) for i, row in updates.items() if not any(v != "" for v in row)]
+        keep = [(i, json.dumps(row, ensure_ascii=False)) for i, row in updates.items()
+                if any(v != "" for v in row)]
+        with self.client._lock:
+            db = self.client._db
+            db.execute("BEGIN")
+            try:
+                db.executemany("DELETE FROM rows WHERE spreadsheet = ? AND sheet = ? AND idx = ?",
+                               [self._key + k for k in drop])
+                db.executemany("INSERT OR REPLACE INTO rows VALUES (?, ?, ?, ?)",
+                               [self._key + k for k in keep])
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+
+    def _last_row(self):
+        return self.client._query(
+            "SELECT COALESCE(MAX(idx), 0) FROM rows WHERE spreadsheet = ? AND sheet = ?", self._key)[0][0]
+
+    def _write(self, start_row, start_col, values):
+        """從 (start_row, start_col) 開始寫入二維 values；值一律存成字串"""
+        rows = self._rows(start_row, start_row + len(values) - 1)
+        updates = {}
+        for r, values_row in enumerate(values, start=start_row):
+            row = list(rows.get(r, []))
+            end = start_col - 1 + len(values_row)
+            row.extend([""] * (end - len(row)))
+            row[start_col - 1:end] = ["" if v is None else str(v) for v in values_row]
+            updates[r] = _trim(row)
+        self._put(updates)
+        width = max((len(v) for v in values), default=0)
+        self._grow(start_row + len(values) - 1, start_col + width - 1)
+
+    # --- gspread 介面 ---
+    def get_all_values(self):
+        with self.client._call('get_all_values'):
+            rows = self._rows()
+        if not rows: return []
+        width = max(len(r) for r in rows.values())
+        return [rows.get(i, []) + [""] * (width - len(rows.get(i, [])))
+                for i in range(1, max(rows) + 1)]
+
+    def get_all_records(self, head=1, default_blank=""):
+        values = self.get_all_values()
+        if len(values) < head: return []
+        keys = values[head - 1]
+        return [dict(zip(keys, numericise_all(row, default_blank=default_blank)))
+                for row in values[head:]]
+
+    def cell(self, row, col):
+        with self.client._call('cell'):
+            found = self.client._query(
+                "SELECT data FROM rows WHERE spreadsheet = ? AND sheet = ? AND idx = ?",
+                self._key + (row,))
+        values = json.loads(found[0][0]) if found else []
+        value = values[col - 1] if col <= len(values) and values[col - 1] != "" else None
+        return Cell(row, col, value)
+
+    def find(self, query):
+        """回傳第一個內容完全相同的儲存格，找不到回傳 None"""
+        with self.client._call('find'):
+            rows = self._rows()
+        for r, row in rows.items():
+            for c, value in enumerate(row, start=1):
+                if value == str(query): return Cell(r, c, value)
+        return None
+
+    def update_cell(self, row, col, value):
+        with self.client._call('update_cell'):
+            self._write(row, col, [[value]])
+
+    def update(self, values, range_name="A1"):
+        # 與 gspread 6 相同以 values 為第一個參數；舊寫法 update('A1', values) 也接受
+        if isinstance(values, str): values, range_name = range_name, values
+        grid = a1_range_to_grid_range(range_name)
+        with self.client._call('update'):
+            self._write(grid.get('startRowIndex', 0) + 1, grid.get('startColumnIndex', 0) + 1, values)
+
+    def batch_update(self, data):
+        with self.client._call('batch_update'):
+            for item in data:
+                grid = a1_range_to_grid_range(item['range'])
+                self._write(grid.get('startRowIndex', 0) + 1, grid.get('startColumnIndex', 0) + 1,
+                            item['values'])
+
+    def batch_clear(self, ranges):
+        with self.client._call('batch_clear'):
+            updates = {}
+            for a1 in ranges:
+                grid = a1_range_to_grid_range(a1)
+                first, last = grid.get('startRowIndex', 0) + 1, grid.get('endRowIndex', self._last_row())
+                col_start, col_end = grid.get('startColumnIndex', 0), grid.get('endColumnIndex')
+                rows = self._rows(first, last)
+                for r in range(first, last + 1):
+                    row = list(updates.get(r, rows.get(r, [])))
+                    stop = len(row) if col_end is None else min(col_end, len(row))
+                    row[col_start:stop] = [""] * max(stop - col_start, 0)
+                    updates[r] = _trim(row)
+            self._put(updates)
+
+    def update_title(self, title):
+        with self.client._call('update_title'):
+            self.client._query("UPDATE worksheets SET title = ? WHERE spreadsheet = ? AND title = ?",
+                               (title,) + self._key)
+            self.client._query("UPDATE rows SET sheet = ? WHERE spreadsheet = ? AND sheet = ?",
+                               (title,) + self._key)
+        self.title = title
+        self._key = (self.spreadsheet.id, title)
+
+    def clear(self):
+        with self.client._call('clear'):
+            self.client._query("DELETE FROM rows WHERE spreadsheet = ? AND sheet = ?", self._key)
+
+    def append_row(self, values, value_input_option="RAW"):
+        self.append_rows([values], value_input_option)
+
+    def append_rows(self, values, value_input_option="RAW"):
+        with self.client._call('append_rows'):
+            self._write(self._last_row() + 1, 1, values)
+
+    def add_rows(self, rows):
+        with self.client._call('add_rows'):
+            self._grow(self.row_count + rows, 0)
+
+    def add_cols(self, cols):
+        with self.client._call('add_cols'):
+            self._grow(0, self.col_count + cols)
+
+
+def _trim(row):
+    """去掉列尾的空字串，與 Sheets API 回傳的格式一致"""
+    end = len(row)
+    while end and row[end - 1] == "": end -= 1
+    return row[:end]
+
+
+def seed_spreadsheet(client, title, sheets):
+    """
+    建立測試用試算表；sheets 為 {分頁名稱: 二維 values}，第一個分頁會成為 sheet1
+    回傳 LocalSpreadsheet
+    """
+    sh = client.create(title)
+    for position, (name, values) in enumerate(sheets.items()):
+        width = max((len(r) for r in values), default=1)
+        if position == 0:
+            ws = sh.sheet1
+            ws.update_title(name)
+        else:
+            ws = sh.add_worksheet(name, max(len(values), 1), width)
+        for start in range(0, len(values), 10000):
+            chunk = itertools.islice(enumerate(values, start=1), start, start + 10000)
+            ws._put({i: _trim(["" if v is None else str(v) for v in row]) for i, row in chunk})
+        ws._grow(len(values), width)
+    return sh
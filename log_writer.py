@@ -0,0 +1,166 @@
+import atexit
+import glob
+import json
+import os
+import queue
+import threading
+import time
+
+import gspread
+
+from shared_cache import file_lock
+
+STALE_CLAIM_AFTER = 600  # 秒；認領後這麼久還在的 spill 檔 (送出途中程序結束) 由其他程序接手補送
+
+
+def is_rate_limited(e):
+    """Google API 回傳 429 (超過每分鐘配額)"""
+    response = getattr(e, 'response', None)
+    return isinstance(e, gspread.exceptions.APIError) and getattr(response, 'status_code', None) == 429
+
+
+class LogWriter:
+    """
+    背景批次寫入 Logs 分頁
+    - submit() 只把資料放進有上限的佇列，不會卡住使用者的登入流程
+    - 背景執行緒每 flush_interval 秒或累積 batch_size 筆，用一次 append_rows 送出
+    - API 失敗 (例如 429 超過配額) 時先寫到本機 spill 檔，之後成功時再補送
+    - spill 檔可能由同一台主機的多個 worker 共用：只在持有檔案鎖時寫入或認領 (改名成本執行緒專用的檔案)，
+      送出時不持有鎖；拿不到鎖時資料先留在記憶體，下次再送
+    - 程式結束時 (atexit) 會把剩下的資料送出
+    """
+
+    def __init__(self, flush_interval=5, batch_size=50, max_queue=1000,
+                 spill_path='logs_spill.jsonl', max_backoff=300):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.spill_path = spill_path
+        self.max_backoff = max_backoff
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.ws = None
+        self._backoff = 0
+        self._retry_at = 0
+        self._spill_lock = threading.Lock()
+        self._held = []  # 拿不到檔案鎖、暫時無法落地的資料
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, ws, row):
+        """排入一筆紀錄；ws 為目前快取的 Logs 分頁物件"""
+        self.ws = ws
+        try:
+            self.queue.put_nowait(row)
+        except queue.Full:
+            # 佇列滿了就直接落地，避免拖慢前台
+            self._spill([row])
+
+    def _run(self):
+        while not self._stop.is_set():
+            rows = self._collect()
+            if rows:
+                self._flush(rows)
+            elif (self._held or os.path.exists(self.spill_path)) and time.time() >= self._retry_at:
+                self._flush([])
+
+    def _collect(self):
+        """等待第一筆，再收集到 batch_size 筆或 flush_interval 秒為止"""
+        rows = []
+        deadline = time.time() + self.flush_interval
+        while len(rows) < self.batch_size:
+            timeout = deadline - time.time()
+            if timeout <= 0 or self._stop.is_set(): break
+            try:
+                rows.append(self.queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return rows
+
+    def _drain(self):
+        rows = []
+        while True:
+            try:
+                rows.append(self.queue.get_nowait())
+            except queue.Empty:
+                return rows
+
+    def _spill_file_lock(self):
+        """同一台主機的多個 worker 可能共用同一個 spill 檔，執行緒鎖之外再加檔案鎖"""
+        return file_lock(f"{self.spill_path}.lock")
+
+    def _flush(self, rows):
+        with self._spill_lock:
+            rows = self._held + rows
+            self._held = []
+        if self.ws is None or time.time() < self._retry_at:
+            self._spill(rows)
+            return
+        claimed, pending = self._claim_spill()
+        pending += rows
+        if not pending: return
+        # 送出時不持有鎖：其他程序照常落地到新的 spill 檔，不會被這次送出後的清理刪掉
+        try:
+            self.ws.append_rows(pending)
+            self._backoff = 0
+        except Exception as e:
+            self._backoff = min(max(self._backoff * 2, self.flush_interval), self.max_backoff)
+            if is_rate_limited(e):
+                self._retry_at = time.time() + self._backoff
+            self._spill(pending)
+        for path in claimed:
+            os.remove(path)
+
+    def _claim_spill(self):
+        """
+        持有檔案鎖把 spill 檔 (以及其他程序送出途中中斷、留下超過 STALE_CLAIM_AFTER 秒的認領檔)
+        改名成本執行緒專用的認領檔；回傳 (認領檔清單, 資料)。拿不到鎖時不認領
+        """
+        with self._spill_lock, self._spill_file_lock() as locked:
+            if not locked: return [], []
+            sources = [self.spill_path] if os.path.exists(self.spill_path) else []
+            now = time.time()
+            for path in glob.glob(f"{glob.escape(self.spill_path)}.*.claimed"):
+                try:
+                    if now - os.path.getmtime(path) >= STALE_CLAIM_AFTER: sources.append(path)
+                except OSError:
+                    pass
+            claimed = []
+            for i, path in enumerate(sources):
+                target = f"{self.spill_path}.{os.getpid()}.{threading.get_ident()}.{i}.claimed"
+                os.replace(path, target)
+                os.utime(target)  # 改名會保留舊的 mtime，重設後才不會被其他程序當成中斷的認領檔
+                claimed.append(target)
+        rows = []
+        for path in claimed:
+            rows += self._read_spill(path)
+        return claimed, rows
+
+    def _spill(self, rows):
+        if not rows: return
+        with self._spill_lock, self._spill_file_lock() as locked:
+            if locked:
+                self._write_spill(rows)
+            else:
+                # 拿不到檔案鎖時不寫檔 (可能與其他程序的認領交錯)，先留在記憶體
+                self._held.extend(rows)
+
+    def _write_spill(self, rows):
+        with open(self.spill_path, 'a', encoding='utf-8') as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+    def _read_spill(self, path):
+        if not os.path.exists(path): return []
+        with open(path, encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def close(self):
+        """停止背景執行緒並送出剩下的紀錄"""
+        if self._stop.is_set(): return
+        self._stop.set()
+        self._thread.join(timeout=self.flush_interval + 5)
+        rows = self._drain()
+        if rows or self._held or os.path.exists(self.spill_path):
+            self._retry_at = 0
+            self._flush(rows)
@@ -0,0 +1,136 @@
+import atexit
+import itertools
+import logging
+import queue
+import smtplib
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class MailDispatcher:
+    """
+    背景寄信佇列 + 重複使用的 SMTP 連線
+    - submit() 立即回傳 job id，由背景執行緒寄出；status(job_id) 供畫面查詢進度
+    - 連線 (EHLO / STARTTLS / login) 建立一次後重複使用，閒置太久或斷線才重連
+    - 寄送失敗時以指數退避重試 max_retries 次
+    - 信已寄出但 on_sent() 拋出例外時記錄例外，狀態為 CALLBACK_FAILED (不算寄送成功)
+    - use_tls=False、不給密碼時不做 STARTTLS / 登入，可直接對本機測試用 SMTP (例如 aiosmtpd) 寄信
+    """
+
+    QUEUED, SENDING, SENT, FAILED = "queued", "sending", "sent", "failed"
+    CALLBACK_FAILED = "callback_failed"
+    FINAL_STATES = (SENT, FAILED, CALLBACK_FAILED)
+
+    def __init__(self, host, port, username="", password="", use_tls=True,
+                 max_retries=3, backoff=2, idle_timeout=60, max_queue=100,
+                 max_jobs=500, timeout=30):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.max_jobs = max_jobs
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.jobs = OrderedDict()
+        self._ids = itertools.count(1)
+        self._smtp = None
+        self._last_used = 0
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="mail-dispatcher", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, msg, on_sent=None):
+        """
+        排入一封信 (email.message.Message)；on_sent 會在寄出成功後於背景執行緒呼叫
+        佇列已滿時回傳 None
+        """
+        job_id = next(self._ids)
+        with self._lock:
+            self.jobs[job_id] = self.QUEUED
+            while len(self.jobs) > self.max_jobs:
+                self.jobs.popitem(last=False)
+        try:
+            self.queue.put_nowait((job_id, msg, on_sent))
+        except queue.Full:
+            self._set(job_id, self.FAILED)
+            return None
+        return job_id
+
+    def status(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def _set(self, job_id, state):
+        with self._lock:
+            if job_id in self.jobs:
+                self.jobs[job_id] = state
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None: break
+            job_id, msg, on_sent = item
+            self._set(job_id, self.SENDING)
+            self._set(job_id, self._deliver(job_id, msg, on_sent))
+
+    def _deliver(self, job_id, msg, on_sent):
+        """寄出 msg 並呼叫 on_sent，回傳最終狀態"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                self._connection().send_message(msg)
+                self._last_used = time.time()
+            except (smtplib.SMTPException, OSError):
+                self._disconnect()
+                if attempt < self.max_retries:
+                    time.sleep(self.backoff * (2 ** attempt))
+                continue
+            if on_sent:
+                try:
+                    on_sent()
+                except Exception:
+                    logger.exception("寄信後處理失敗 (job %s)", job_id)
+                    return self.CALLBACK_FAILED
+            return self.SENT
+        return self.FAILED
+
+    def _connection(self):
+        """回傳可用的連線；閒置超過 idle_timeout 先用 NOOP 確認伺服器還在"""
+        if self._smtp is not None and time.time() - self._last_used > self.idle_timeout:
+            try:
+                self._smtp.noop()
+            except (smtplib.SMTPException, OSError):
+                self._disconnect()
+        if self._smtp is None:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            smtp.ehlo()
+            if self.use_tls:
+                smtp.starttls()
+                smtp.ehlo()
+            if self.username and self.password:
+                smtp.login(self.username, self.password)
+            self._smtp = smtp
+            self._last_used = time.time()
+        return self._smtp
+
+    def _disconnect(self):
+        if self._smtp is None: return
+        try:
+            self._smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+        self._smtp = None
+
+    def close(self):
+        """寄完佇列中的信後關閉連線"""
+        if not self._thread.is_alive(): return
+        self.queue.put(None)
+        self._thread.join(timeout=self.timeout)
+        self._disconnect()
@@ -0,0 +1,148 @@
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class Metrics:
+    """
+    程序內的輕量計時與快取命中統計 (所有 session / 背景執行緒共用)
+    - span(name): 量測一段程式的耗時，每個名稱保留最近 window 筆供計算 p50 / p95
+    - cache(name, hit): 記錄一次快取查詢是否命中；st.cache_* 函式可用 lookup() + miss()
+    - 超過 slow_threshold 秒的 span 以 JSON 寫入 log，方便事後搜尋
+    - prometheus_text(): Prometheus text exposition 格式；write_textfile() 給 node_exporter 讀
+    """
+
+    def __init__(self, window=1000, slow_threshold=1.0, prefix="price_system"):
+        self.window = window
+        self.slow_threshold = slow_threshold
+        self.prefix = prefix
+        self._spans = {}
+        self._totals = {}
+        self._caches = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def timed(self, name):
+        """裝飾器版本的 span"""
+        def wrap(fn):
+            @functools.wraps(fn)
+            def inner(*args, **kwargs):
+                with self.span(name):
+                    return fn(*args, **kwargs)
+            return inner
+        return wrap
+
+    def observe(self, name, seconds, **fields):
+        """直接記錄一筆耗時 (例如子程序回傳的秒數)；fields 只出現在慢速 log"""
+        with self._lock:
+            if name not in self._spans:
+                self._spans[name] = deque(maxlen=self.window)
+                self._totals[name] = [0, 0.0]
+            self._spans[name].append(seconds)
+            self._totals[name][0] += 1
+            self._totals[name][1] += seconds
+        if seconds >= self.slow_threshold:
+            logger.info(json.dumps({'span': name, 'seconds': round(seconds, 4), **fields},
+                                   ensure_ascii=False))
+
+    def cache(self, name, hit):
+        with self._lock:
+            counts = self._caches.setdefault(name, [0, 0])
+            counts[0] += 1
+            counts[1] += 0 if hit else 1
+
+    @contextmanager
+    def lookup(self, name):
+        """包住對快取函式的呼叫；函式本體有執行 (呼叫了 miss()) 就算未命中"""
+        self._local.miss = False
+        try:
+            yield
+        finally:
+            self.cache(name, hit=not self._local.miss)
+
+    def miss(self):
+        self._local.miss = True
+
+    def summary(self):
+        """回傳 ({span: {count, total, p50, p95}}, {cache: {requests, misses, hit_ratio}})"""
+        with self._lock:
+            spans = {name: (sorted(values), list(self._totals[name])) for name, values in self._spans.items()}
+            caches = {name: list(counts) for name, counts in self._caches.items()}
+        span_stats = {}
+        for name, (values, (count, total)) in sorted(spans.items()):
+            span_stats[name] = {
+                'count': count,
+                'total': total,
+                'p50': _quantile(values, 0.5),
+                'p95': _quantile(values, 0.95),
+            }
+        cache_stats = {}
+        for name, (requests, misses) in sorted(caches.items()):
+            cache_stats[name] = {
+                'requests': requests,
+                'misses': misses,
+                'hit_ratio': (requests - misses) / requests if requests else 0.0,
+            }
+        return span_stats, cache_stats
+
+    def prometheus_text(self):
+        spans, caches = self.summary()
+        p = self.prefix
+        lines = [f"# TYPE {p}_span_seconds summary"]
+        for name, s in spans.items():
+            label = f'span="{name}"'
+            lines.append(f'{p}_span_seconds{{{label},quantile="0.5"}} {s["p50"]:.6f}')
+            lines.append(f'{p}_span_seconds{{{label},quantile="0.95"}} {s["p95"]:.6f}')
+            lines.append(f'{p}_span_seconds_count{{{label}}} {s["count"]}')
+            lines.append(f'{p}_span_seconds_sum{{{label}}} {s["total"]:.6f}')
+        lines.append(f"# TYPE {p}_cache_requests_total counter")
+        for name, c in caches.items():
+            lines.append(f'{p}_cache_requests_total{{cache="{name}"}} {c["requests"]}')
+        lines.append(f"# TYPE {p}_cache_misses_total counter")
+        for name, c in caches.items():
+            lines.append(f'{p}_cache_misses_total{{cache="{name}"}} {c["misses"]}')
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path):
+        """寫到暫存檔再 os.replace，讀取端不會看到寫一半的內容"""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+    def start_export(self, path, interval=15):
+        """背景執行緒每 interval 秒更新一次 textfile"""
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.write_textfile(path)
+                except OSError:
+                    logger.exception("寫入 metrics 檔案失敗: %s", path)
+        thread = threading.Thread(target=run, name="metrics-export", daemon=True)
+        thread.start()
+        return thread
+
+
+def _quantile(sorted_values, q):
+    if not sorted_values: return 0.0
+    return sorted_values[min(int(len(sorted_values) * q), len(sorted_values) - 1)]
+
+
+# 整個程序共用一份；app 與 data_merger 都直接 import 使用
+metrics = Metrics()
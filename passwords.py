@@ -0,0 +1,60 @@
+import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import bcrypt
+
+DEFAULT_ROUNDS = 12  # bcrypt.gensalt() 的預設成本
+
+_COST_RE = re.compile(r'^\$2[abxy]?\$(\d{2})\$')
+
+
+def hash_password(plain_text, rounds=DEFAULT_ROUNDS):
+    return bcrypt.hashpw(plain_text.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def check_password(plain_text, hashed_text):
+    try:
+        return bcrypt.checkpw(plain_text.encode('utf-8'), hashed_text.encode('utf-8'))
+    except: return False
+
+
+def hash_cost(hashed_text):
+    """從 $2b$12$... 取出成本參數，格式不符回傳 None"""
+    m = _COST_RE.match(str(hashed_text))
+    return int(m.group(1)) if m else None
+
+
+class PasswordHasher:
+    """
+    bcrypt 運算交給有上限的執行緒池 (bcrypt 計算時會釋放 GIL)
+    登入尖峰時同時進行的雜湊數量固定為 workers，不會把 CPU 塞滿
+    """
+
+    def __init__(self, rounds=DEFAULT_ROUNDS, workers=4):
+        self.rounds = rounds
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+
+    def hash(self, plain_text):
+        return self.pool.submit(hash_password, plain_text, self.rounds).result()
+
+    def check(self, plain_text, hashed_text):
+        return self.pool.submit(check_password, plain_text, hashed_text).result()
+
+    def needs_rehash(self, hashed_text):
+        """資料庫中的雜湊成本與目前設定不同時需要重新雜湊"""
+        cost = hash_cost(hashed_text)
+        return cost is not None and cost != self.rounds
+
+
+def _hash_one(args):
+    plain_text, rounds = args
+    return hash_password(plain_text, rounds)
+
+
+def hash_many(passwords, rounds=DEFAULT_ROUNDS, workers=None):
+    """批次雜湊 (多程序平行)，回傳順序與輸入相同"""
+    passwords = list(passwords)
+    if workers == 1 or len(passwords) <= 1:
+        return [hash_password(p, rounds) for p in passwords]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_hash_one, [(p, rounds) for p in passwords], chunksize=4))
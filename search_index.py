@@ -0,0 +1,157 @@
+import re
+from array import array
+from collections import defaultdict
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+try:
+    TEXT_DTYPE = pd.StringDtype("pyarrow")
+except ImportError:  # 沒有 pyarrow 時退回 pandas 的 python 字串陣列
+    TEXT_DTYPE = pd.StringDtype("python")
+
+# 型號切詞：英數字與 - / . 組成的連續字串 (例如 FX5U-32MT/ES)
+CODE_TOKEN_RE = re.compile(r'[0-9a-z][0-9a-z\-/.]*')
+
+
+def normalize(text):
+    """統一大小寫與全形括號，讓查詢與索引使用同一套規則"""
+    if text is None: return ""
+    return str(text).replace('（', '(').replace('）', ')').lower()
+
+
+def normalize_cell(value):
+    """
+    建索引用：缺值 (None / NaN / pd.NA，或轉成字串後的 'nan' / '<NA>') 視為空白。
+    查詢字串不經過這裡，輸入 nan 就是搜尋 nan
+    """
+    if value is None or (isinstance(value, float) and value != value): return ""
+    s = str(value)
+    if s in ('nan', '<NA>'): return ""
+    return normalize(s)
+
+
+class SearchIndex:
+    """
+    牌價表的記憶體搜尋索引 (每次 load_data() 重新整理時建立一次)
+    - texts: 每一列 SEARCH_COLS 合併後的正規化字串 (Arrow 字串陣列)，用來做最後的字面比對
+    - grams: 1-gram / 2-gram 的倒排表 (中文說明也能快速縮小候選列)
+    - tokens: 型號 token 排序後的清單 (Arrow 字串陣列)，以二分搜尋做前綴查詢
+    倒排表都存成一整條 int32 陣列 + 每個鍵的起訖 offset，不為每一列建立 Python 物件，
+    索引的大小與牌價表本身同一個量級。
+    查詢一律是字面比對 (不是 regex)，所以 FX5U-32MT/ES 或 ( 都能直接搜尋。
+    """
+
+    def __init__(self, rows, code_rows=None):
+        texts = []
+        grams = defaultdict(partial(array, 'i'))
+        if code_rows is None:  # 沒有另外指定型號欄位時，型號 token 也從搜尋欄位切
+            rows = code_rows = list(rows)
+        for pos, fields in enumerate(rows):
+            text = "\x00".join(normalize_cell(v) for v in fields)
+            texts.append(text)
+            seen = set()
+            for i, ch in enumerate(text):
+                if ch == "\x00": continue
+                seen.add(ch)
+                nxt = text[i + 1:i + 2]
+                if nxt and nxt != "\x00":
+                    seen.add(ch + nxt)
+            for g in seen:
+                grams[g].append(pos)
+        self.texts = pd.array(texts, dtype=TEXT_DTYPE)
+        del texts
+        gram_keys, self._gram_offsets, self._gram_postings = _pack(grams)
+        self._gram_ids = {g: i for i, g in enumerate(gram_keys)}
+
+        tokens = defaultdict(partial(array, 'i'))
+        for pos, fields in enumerate(code_rows):
+            found = set()
+            for v in fields:
+                found.update(CODE_TOKEN_RE.findall(normalize_cell(v)))
+            for tok in found:
+                tokens[tok].append(pos)
+        token_keys, self._token_offsets, self._token_postings = _pack(tokens, sort_keys=True)
+        self.tokens = pd.array(token_keys, dtype=TEXT_DTYPE)
+
+    def __len__(self):
+        return len(self.texts)
+
+    def _posting(self, gram):
+        gid = self._gram_ids.get(gram)
+        if gid is None: return None
+        return self._gram_postings[self._gram_offsets[gid]:self._gram_offsets[gid + 1]]
+
+    def _bisect(self, key):
+        """tokens 中第一個 >= key 的位置"""
+        lo, hi = 0, len(self.tokens)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.tokens[mid] < key: lo = mid + 1
+            else: hi = mid
+        return lo
+
+    def prefix_match(self, query):
+        """回傳型號以 query 開頭的列位置 (已排序的 int32 陣列)"""
+        q = normalize(query).strip()
+        if not q: return np.empty(0, dtype=np.int32)
+        first, last = self._bisect(q), self._bisect(q + "\U0010ffff")
+        hits = self._token_postings[self._token_offsets[first]:self._token_offsets[last]]
+        return np.unique(hits)
+
+    def search(self, query):
+        """
+        回傳符合 query 的列位置 (int32 陣列)：型號前綴命中的排前面，其餘依原始順序。
+        空白查詢回傳 None，代表「全部資料」。
+        """
+        q = normalize(query).strip()
+        if not q: return None
+        empty = np.empty(0, dtype=np.int32)
+
+        if len(q) == 1:
+            candidates = self._posting(q)
+            if candidates is None: return empty
+        else:
+            candidates = None
+            for i in range(len(q) - 1):
+                posting = self._posting(q[i:i + 2])
+                if posting is None: return empty
+                if candidates is None or len(posting) < len(candidates):
+                    candidates = posting
+        if not len(candidates): return empty
+
+        found = pd.Series(self.texts.take(candidates)).str.contains(q, regex=False)
+        matched = candidates[found.to_numpy(dtype=bool)]
+        if not len(matched): return empty
+
+        prefix_hits = np.intersect1d(self.prefix_match(q), matched, assume_unique=True)
+        if not len(prefix_hits): return matched
+        return np.concatenate([prefix_hits, matched[~np.isin(matched, prefix_hits, assume_unique=True)]])
+
+
+def _pack(postings, sort_keys=False):
+    """
+    {鍵: array('i') 列位置} -> (鍵清單, offsets, 整條 int32 postings)；
+    第 k 個鍵的列位置為 postings[offsets[k]:offsets[k + 1]]。邊搬邊釋放原本的 array
+    """
+    keys = sorted(postings) if sort_keys else list(postings)
+    offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+    np.cumsum([len(postings[k]) for k in keys], out=offsets[1:])
+    flat = array('i')
+    for k in keys:
+        flat.extend(postings.pop(k))
+    return keys, offsets, np.frombuffer(flat, dtype=np.int32)
+
+
+def build_search_index(df, search_cols, code_cols=None):
+    """從 DataFrame 建立 SearchIndex，缺少的欄位自動略過"""
+    cols = [c for c in search_cols if c in df.columns]
+    if df.empty or not cols:
+        return SearchIndex([])
+    rows = zip(*(df[c].tolist() for c in cols))
+    code_rows = None
+    if code_cols is not None:
+        ccols = [c for c in code_cols if c in df.columns]
+        code_rows = list(zip(*(df[c].tolist() for c in ccols))) if ccols else [()] * len(df)
+    return SearchIndex(rows, code_rows)
\ No newline at end of file
@@ -0,0 +1,119 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows 沒有 fcntl：不做跨程序鎖定，各程序各自讀取 (結果仍會共用)
+    fcntl = None
+
+LOCK_POLL_INTERVAL = 0.05  # 秒；等待檔案鎖時的輪詢間隔
+
+
+@contextmanager
+def file_lock(path, timeout=30.0):
+    """
+    跨程序的互斥鎖 (flock，每次都開新的 fd，同一程序的不同執行緒之間也互斥)
+    yield 是否取得鎖；等超過 timeout 秒就不再等 (yield False)，呼叫端照常執行，
+    避免持有鎖的程序卡住時拖住其他 worker。沒有 fcntl 時不鎖定，一律 yield True
+    """
+    if fcntl is None:
+        yield True
+        return
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        deadline = time.monotonic() + timeout
+        locked = False
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                locked = True
+                break
+            except BlockingIOError:
+                if time.monotonic() >= deadline: break
+                time.sleep(LOCK_POLL_INTERVAL)
+        try:
+            yield locked
+        finally:
+            if locked: fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
+
+
+class SharedCache:
+    """
+    同一台主機上所有 worker 共用的小型快取 (例如 Users!D1 更新日期、Users 帳號表)
+    - 每個項目是 directory 中的一個 JSON 檔 {fetched_at, value}，寫到暫存檔再 os.replace
+    - get(): 檔案未過期就直接使用；過期時只有取得檔案鎖的程序呼叫 fetch() (single-flight)，
+      其他程序等它寫好後直接讀檔
+    - invalidate(): 資料被改寫時 (例如修改密碼) 讓所有程序下次重新讀取；
+      失效前就開始的讀取結果不會寫回快取 (也不會被當成新的資料讀出)
+    - invalidated_at(): 最近一次失效的時間，程序內另外保存的副本可據此判斷是否過期
+    - 目錄與檔案只限本帳號讀寫 (Users 表含密碼雜湊)
+    """
+
+    def __init__(self, directory, lock_timeout=30.0):
+        self.directory = directory
+        self.lock_timeout = lock_timeout
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+
+    def _path(self, name, suffix='.json'):
+        return os.path.join(self.directory, name + suffix)
+
+    def read(self, name):
+        """回傳 (value, fetched_at)；沒有檔案或讀取失敗回傳 None"""
+        try:
+            with open(self._path(name), encoding='utf-8') as f:
+                entry = json.load(f)
+            return entry['value'], float(entry['fetched_at'])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def write(self, name, value, fetched_at=None):
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        path = self._path(name)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'fetched_at': fetched_at, 'value': value}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def invalidate(self, name):
+        marker = self._path(name, '.invalid')
+        with open(marker, 'w', encoding='utf-8'):
+            pass
+        os.utime(marker)
+        try:
+            os.remove(self._path(name))
+        except FileNotFoundError:
+            pass
+
+    def invalidated_at(self, name):
+        """最近一次 invalidate(name) 的時間；從未失效回傳 0"""
+        try:
+            return os.path.getmtime(self._path(name, '.invalid'))
+        except OSError:
+            return 0.0
+
+    def _fresh(self, name, ttl):
+        entry = self.read(name)
+        if entry and time.time() - entry[1] < ttl and entry[1] > self.invalidated_at(name): return entry
+        return None
+
+    def get(self, name, ttl, fetch):
+        """
+        回傳 (value, fetched_at)；fetched_at 是資料實際讀取的時間 (可能是其他程序讀的)
+        fetch() 的例外直接拋出，不會寫入快取
+        """
+        entry = self._fresh(name, ttl)
+        if entry: return entry
+        with file_lock(self._path(name, '.lock'), self.lock_timeout):
+            entry = self._fresh(name, ttl)  # 等鎖期間其他程序可能已經更新
+            if entry: return entry
+            fetched_at = time.time()
+            value = fetch()
+            if self.invalidated_at(name) < fetched_at:
+                self.write(name, value, fetched_at)
+        return value, fetched_at
@@ -0,0 +1,315 @@
+import hashlib
+import json
+import os
+import random
+import time
+from collections import Counter
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import pandas as pd
+from gspread.exceptions import APIError
+from gspread.utils import rowcol_to_a1
+
+# 單次 batch_update 的上限 (Sheets API 單一請求不宜超過約 10MB)
+CHUNK_ROWS = 5000
+MAX_CELLS_PER_REQUEST = 50000
+UPLOAD_WORKERS = 4  # 同時進行的 batch_update 請求數 (寫入配額是每分鐘計算，太多只會一直被 429)
+# 配額用完 (429) 與暫時性的伺服器錯誤以指數退避重試
+RETRY_STATUS = {429, 500, 502, 503, 504}
+MAX_RETRIES = 6
+BACKOFF_BASE = 1.0   # 秒；第 n 次重試約等待 BACKOFF_BASE * 2^n (加上隨機抖動)
+BACKOFF_MAX = 64.0
+
+
+class UploadError(Exception):
+    """整張上傳中途失敗；checkpoint 已記錄寫入完成的區塊，重新執行會從中斷處繼續"""
+
+    def __init__(self, cause, done, total):
+        super().__init__(f"{cause} (已完成 {done}/{total} 個區塊，重新執行會從中斷處繼續)")
+        self.cause = cause
+        self.done = done
+        self.total = total
+
+
+def _status(error):
+    return getattr(getattr(error, 'response', None), 'status_code', None) or getattr(error, 'code', None)
+
+
+def _retry_after(error):
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    try:
+        return float(headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+def call_with_backoff(fn, *args, retries=MAX_RETRIES, on_retry=None):
+    """
+    呼叫 fn(*args)；遇到 RETRY_STATUS 的 APIError 時等待後重試 (有 Retry-After 就照它等)，
+    重試 retries 次仍失敗才拋出。on_retry(error, 等待秒數) 可用來統計
+    """
+    for attempt in range(retries + 1):
+        try:
+            return fn(*args)
+        except APIError as e:
+            if _status(e) not in RETRY_STATUS or attempt == retries: raise
+            delay = _retry_after(e) or min(BACKOFF_BASE * 2 ** attempt, BACKOFF_MAX) * random.uniform(0.5, 1.0)
+            if on_retry: on_retry(e, delay)
+            time.sleep(delay)
+
+
+def send_batches(ws, batches, workers=UPLOAD_WORKERS, on_done=None, on_retry=None):
+    """
+    以最多 workers 個同時進行的 batch_update 送出 batches；batches 產生 (key, data)，
+    可以是 generator (送出多少才產生多少，不會一次展開)。
+    每個請求成功後在呼叫端執行緒呼叫 on_done(key)；有請求重試後仍失敗時不再送出新的請求，
+    等進行中的請求結束後拋出第一個錯誤。回傳成功的請求數
+    """
+    workers = max(workers, 1)
+    pending = {}
+    state = {'requests': 0, 'error': None}
+
+    def collect(return_when):
+        finished, _ = wait(pending, return_when=return_when)
+        for future in finished:
+            key = pending.pop(future)
+            try:
+                future.result()
+            except Exception as e:
+                state['error'] = state['error'] or e
+                continue
+            state['requests'] += 1
+            if on_done: on_done(key)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sheet-upload") as pool:
+        for key, data in batches:
+            if len(pending) >= workers:
+                collect(FIRST_COMPLETED)
+            if state['error']: break
+            pending[pool.submit(call_with_backoff, ws.batch_update, data, on_retry=on_retry)] = key
+        if pending:
+            collect(ALL_COMPLETED)
+    if state['error']: raise state['error']
+    return state['requests']
+
+
+def _pad(row, width):
+    row = ["" if v is None else str(v) for v in row]
+    return row + [""] * (width - len(row))
+
+
+def _row_keys(rows, key_idx):
+    """每列的鍵：key 欄位值 + 第幾次出現 (同鍵重複時仍可一一對應)"""
+    seen = Counter()
+    keys = []
+    for row in rows:
+        base = tuple(row[i] if i < len(row) else "" for i in key_idx) if key_idx else tuple(row)
+        keys.append(base + (seen[base],))
+        seen[base] += 1
+    return keys
+
+
+def plan_layout(old_rows, new_rows, old_header, header, key_cols):
+    """
+    決定每一筆新資料要放在哪一列，盡量讓鍵相同的資料留在原本的列：
+    1. 鍵已存在的列放回原位
+    2. 新增的資料先補進被刪除資料留下的空位，不夠再接在最後
+    3. 仍有空位時把最後面的資料搬進來，讓表格保持連續
+    回傳新的列清單 (不含標題)。注意列順序可能與 new_rows 不同。
+    """
+    key_cols = key_cols or []
+    if any(c not in header or c not in old_header for c in key_cols):
+        return list(new_rows)
+    new_keys = _row_keys(new_rows, [header.index(c) for c in key_cols])
+    old_keys = _row_keys(old_rows, [old_header.index(c) for c in key_cols])
+    slot_of = {k: i for i, k in enumerate(old_keys)}
+
+    slots = [None] * len(old_rows)
+    unplaced = []
+    for key, row in zip(new_keys, new_rows):
+        i = slot_of.get(key)
+        if i is None: unplaced.append(row)
+        else: slots[i] = row
+
+    holes = [i for i, row in enumerate(slots) if row is None]
+    for i, row in zip(holes, unplaced):
+        slots[i] = row
+    slots.extend(unplaced[len(holes):])
+    holes = holes[len(unplaced):]
+
+    for hole in holes:
+        while slots and slots[-1] is None:
+            slots.pop()
+        if hole >= len(slots): break
+        slots[hole] = slots.pop()
+    while slots and slots[-1] is None:
+        slots.pop()
+    return slots
+
+
+def _changed_ranges(old_rows, rows):
+    """找出內容有變的連續列區段，回傳 [(起始 index, 結束 index)] (含頭含尾)"""
+    ranges = []
+    start = None
+    for i, row in enumerate(rows):
+        old = old_rows[i] if i < len(old_rows) else None
+        if row != old:
+            if start is None: start = i
+        elif start is not None:
+            ranges.append((start, i - 1))
+            start = None
+    if start is not None:
+        ranges.append((start, len(rows) - 1))
+    return ranges
+
+
+def sync_worksheet(ws, df, key_cols=None, chunk_rows=CHUNK_ROWS, max_cells=MAX_CELLS_PER_REQUEST,
+                   workers=UPLOAD_WORKERS):
+    """
+    以差異更新的方式把 df 寫到分頁，不先 clear，線上查詢不會讀到空表
+    - key_cols: 用來對應新舊資料的欄位 (例如 規格 + 來源檔案 + 來源分頁)；
+      None 代表以整列內容比對
+    - 只有內容變動的列會以 batch_update 送出，每個請求最多 max_cells 格，最多 workers 個同時進行
+    - 資料變少時最後才清掉多出來的舊列
+    - 中途失敗時重新執行即可：已寫入的列不會再被視為變動
+    回傳 {'rows', 'changed', 'requests', 'cleared', 'retries'} 統計
+    """
+    retries = []
+    on_retry = lambda e, delay: retries.append(delay)
+    header = [str(c) for c in df.columns]
+    existing = call_with_backoff(ws.get_all_values, on_retry=on_retry)
+    old_header = existing[0] if existing else []
+    width = max(len(header), len(old_header), 1)
+    chunk_rows = max(min(chunk_rows, max_cells // width), 1)
+
+    old_rows = [_pad(row, width) for row in existing[1:]]
+    new_rows = [_pad(row, width) for row in df.itertuples(index=False, name=None)]
+
+    rows = plan_layout(old_rows, new_rows, old_header, header, key_cols)
+
+    # 表格不夠大時先擴充，避免寫入超出範圍
+    _ensure_size(ws, len(rows) + 1, width, on_retry)
+
+    updates = []
+    if _pad(header, width) != _pad(old_header, width):
+        updates.append({'range': f"A1:{rowcol_to_a1(1, width)}", 'values': [_pad(header, width)]})
+    for start, end in _changed_ranges(old_rows, rows):
+        for chunk_start in range(start, end + 1, chunk_rows):
+            chunk_end = min(chunk_start + chunk_rows - 1, end)
+            updates.append({
+                'range': f"{rowcol_to_a1(chunk_start + 2, 1)}:{rowcol_to_a1(chunk_end + 2, width)}",
+                'values': rows[chunk_start:chunk_end + 1],
+            })
+
+    def batches():
+        batch, cells = [], 0
+        for update in updates:
+            size = len(update['values']) * width
+            if batch and cells + size > max_cells:
+                yield None, batch
+                batch, cells = [], 0
+            batch.append(update)
+            cells += size
+        if batch:
+            yield None, batch
+
+    requests = send_batches(ws, batches(), workers, on_retry=on_retry)
+
+    cleared = max(len(old_rows) - len(rows), 0)
+    if cleared:
+        first, last = len(rows) + 2, len(old_rows) + 1
+        call_with_backoff(ws.batch_clear, [f"{rowcol_to_a1(first, 1)}:{rowcol_to_a1(last, width)}"],
+                          on_retry=on_retry)
+        requests += 1
+
+    changed = sum(len(u['values']) for u in updates)
+    return {'rows': len(rows), 'changed': changed, 'requests': requests, 'cleared': cleared,
+            'retries': len(retries)}
+
+
+def _ensure_size(ws, rows, cols, on_retry=None):
+    """表格不夠大時先擴充，避免寫入超出範圍"""
+    if rows > ws.row_count:
+        call_with_backoff(ws.add_rows, rows - ws.row_count, on_retry=on_retry)
+    if cols > ws.col_count:
+        call_with_backoff(ws.add_cols, cols - ws.col_count, on_retry=on_retry)
+
+
+def frame_fingerprint(df, chunk_rows):
+    """資料內容 + 區塊大小的雜湊；checkpoint 只在兩者都相同時沿用"""
+    h = hashlib.sha256(json.dumps([str(c) for c in df.columns], ensure_ascii=False).encode('utf-8'))
+    h.update(pd.util.hash_pandas_object(df.astype(str), index=False).values.tobytes())
+    h.update(str(chunk_rows).encode('ascii'))
+    return h.hexdigest()
+
+
+def _load_checkpoint(path, fingerprint):
+    """回傳上次已寫入的區塊編號 (set)；資料不同或沒有 checkpoint 時回傳空集合"""
+    if not path: return set()
+    try:
+        with open(path, encoding='utf-8') as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        return set()
+    return set(saved.get('done', [])) if saved.get('fingerprint') == fingerprint else set()
+
+
+def _save_checkpoint(path, fingerprint, done):
+    if not path: return
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'fingerprint': fingerprint, 'done': sorted(done)}, f)
+    os.replace(tmp_path, path)
+
+
+def upload_chunks(ws, df, checkpoint=None, chunk_rows=CHUNK_ROWS, max_cells=MAX_CELLS_PER_REQUEST,
+                  workers=UPLOAD_WORKERS):
+    """
+    整張覆寫 (取代 clear() + 單一 update 送出整張表)
+    - 標題列之後每 chunk_rows 列一個區塊，送出前才從 df 轉成 list，不會展開整張表
+    - 最多 workers 個 batch_update 同時進行；429 / 5xx 以指數退避重試
+    - checkpoint: 記錄已寫入的區塊 (JSON 檔)；資料與上次相同時略過這些區塊，從中斷處繼續，
+      全部完成後刪除
+    - 不先清空分頁，寫完後才清掉多出來的舊列，線上查詢不會讀到空表
+    失敗時拋出 UploadError；成功回傳 {'rows', 'chunks', 'resumed', 'requests', 'cleared', 'retries'}
+    """
+    header = [str(c) for c in df.columns]
+    width = max(len(header), 1)
+    chunk_rows = max(min(chunk_rows, max_cells // width), 1)
+    total = (len(df) + chunk_rows - 1) // chunk_rows
+    fingerprint = frame_fingerprint(df, chunk_rows)
+    done = _load_checkpoint(checkpoint, fingerprint)
+    resumed = len(done)
+    retries = []
+    on_retry = lambda e, delay: retries.append(delay)
+
+    def chunks():
+        for i in range(total):
+            if i in done: continue
+            start = i * chunk_rows
+            rows = [_pad(row, width) for row in df.iloc[start:start + chunk_rows].itertuples(index=False, name=None)]
+            yield i, [{'range': f"{rowcol_to_a1(start + 2, 1)}:{rowcol_to_a1(start + len(rows) + 1, width)}",
+                       'values': rows}]
+
+    def commit(i):
+        done.add(i)
+        _save_checkpoint(checkpoint, fingerprint, done)
+
+    try:
+        old_rows = ws.row_count
+        _ensure_size(ws, len(df) + 1, width, on_retry)
+        call_with_backoff(ws.batch_update, [{'range': f"A1:{rowcol_to_a1(1, width)}", 'values': [_pad(header, width)]}],
+                          on_retry=on_retry)
+        requests = 1 + send_batches(ws, chunks(), workers, commit, on_retry)
+        cleared = max(old_rows - len(df) - 1, 0)
+        if cleared:
+            call_with_backoff(ws.batch_clear, [f"{rowcol_to_a1(len(df) + 2, 1)}:{rowcol_to_a1(old_rows, width)}"],
+                              on_retry=on_retry)
+            requests += 1
+    except Exception as e:
+        raise UploadError(e, len(done), total) from e
+
+    if checkpoint and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    return {'rows': len(df), 'chunks': total, 'resumed': resumed, 'requests': requests,
+            'cleared': cleared, 'retries': len(retries)}
@@ -0,0 +1,63 @@
+import threading
+import time
+
+
+class UserDirectory:
+    """
+    Users 分頁的記憶體索引：email -> (列號, 密碼雜湊, 姓名)
+    - 整個程序共用，ttl 秒後視為過期，下次查詢時重新下載
+    - 查不到的 email 最多每 miss_refresh 秒重新下載一次 (新帳號不用等滿 ttl)
+    - 修改密碼後直接 set_password() 就地更新，不必重新下載；其他程序經由 needs_refresh() 的
+      invalidated_at (主機共用快取的失效時間) 得知資料已改寫，下次查詢立即重新載入
+    """
+
+    def __init__(self, ttl=60, miss_refresh=15):
+        self.ttl = ttl
+        self.miss_refresh = miss_refresh
+        self.users = {}
+        self.password_col = 2
+        self.loaded_at = 0
+        self._lock = threading.Lock()
+
+    def load(self, values, loaded_at=None):
+        """
+        以 ws.get_all_values() 的結果重建索引 (第一列為標題)
+        loaded_at: 資料實際讀取的時間 (來自主機共用快取時可能早於現在)
+        """
+        users = {}
+        password_col = 2
+        if values:
+            header = [str(h).strip() for h in values[0]]
+            email_idx = header.index('email') if 'email' in header else 0
+            pwd_idx = header.index('password') if 'password' in header else 1
+            name_idx = header.index('name') if 'name' in header else None
+            password_col = pwd_idx + 1
+            for row_num, row in enumerate(values[1:], start=2):
+                cells = list(row) + [''] * (len(header) - len(row))
+                email = str(cells[email_idx]).strip()
+                if not email: continue
+                name = str(cells[name_idx]) if name_idx is not None else ""
+                # 重複的 email 以第一筆為準 (與原本逐列比對的行為一致)
+                users.setdefault(email, (row_num, str(cells[pwd_idx]), name))
+        with self._lock:
+            self.users = users
+            self.password_col = password_col
+            self.loaded_at = time.time() if loaded_at is None else loaded_at
+
+    def needs_refresh(self, email, invalidated_at=0.0):
+        """invalidated_at: 資料最近一次被改寫的時間，晚於 loaded_at 代表索引已過期"""
+        email = email.strip()
+        if invalidated_at > self.loaded_at: return True
+        age = time.time() - self.loaded_at
+        if age >= self.ttl: return True
+        return email not in self.users and age >= self.miss_refresh
+
+    def get(self, email):
+        return self.users.get(email.strip())
+
+    def set_password(self, email, hashed):
+        email = email.strip()
+        with self._lock:
+            user = self.users.get(email)
+            if user:
+                self.users[email] = (user[0], hashed, user[2])